@@ -1,9 +1,10 @@
+import asyncio
 import json
 import logging
 from pathlib import Path
 from typing import NotRequired, TypedDict
 
-from aiohttp.web import Response, View
+from aiohttp.web import Response, StreamResponse, View
 from aiohttp.web_exceptions import (
     HTTPBadRequest,
     HTTPConflict,
@@ -13,11 +14,24 @@ from aiohttp.web_exceptions import (
 
 from .filters import DuplicateFilterError, FilterNotFoundError
 from .hah import upload_finished_hah
-from .keys import CONTEXT, FILTER_STORE, TASK_MANAGER, UPLOADER
-from .links import upload_from_url
+from .keys import (
+    COMPRESSOR,
+    CONTEXT,
+    EVENTS,
+    FILTER_STORE,
+    TASK_MANAGER,
+    TRANSMISSION,
+    UPLOADER,
+)
+from .links import schedule_upload_from_url
 from .torrent import add_urls, get_completed, schedule_upload_by_id
 
 
+# A client that cannot take an event this fast is dropped.
+WRITE_TIMEOUT = 10
+# Idle streams get a comment this often, so proxies keep them open and gone
+# clients are noticed.
+KEEPALIVE_INTERVAL = 15
 _L = logging.getLogger(__name__)
 
 
@@ -48,10 +62,12 @@ class TorrentsHandler(View):
 
         task_manager = self.request.app[TASK_MANAGER]
         uploader = self.request.app[UPLOADER]
+        torrent_client = self.request.app[TRANSMISSION]
         schedule_upload_by_id(
             task_manager=task_manager,
             uploader=uploader,
             transmission=ctx.transmission,
+            torrent_client=torrent_client,
             torrent_id=int(torrent_id),
         )
         return Response(status=204)
@@ -62,8 +78,9 @@ class TorrentsHandler(View):
             _L.error("no transmission")
             raise HTTPInternalServerError
 
+        torrent_client = self.request.app[TRANSMISSION]
         try:
-            torrents = get_completed(ctx.transmission)
+            torrents = await get_completed(torrent_client)
         except Exception as e:
             _L.error(f"transmission error: {e}, data: {ctx.transmission}")
             raise HTTPInternalServerError
@@ -75,6 +92,7 @@ class TorrentsHandler(View):
                 task_manager=task_manager,
                 uploader=uploader,
                 transmission=ctx.transmission,
+                torrent_client=torrent_client,
                 torrent_id=t.id,
             )
         result = [_.id for _ in torrents]
@@ -86,7 +104,8 @@ class TorrentsHandler(View):
             _L.error("no transmission")
             raise HTTPInternalServerError
 
-        torrent_dict = await add_urls(urls, transmission=ctx.transmission)
+        torrent_client = self.request.app[TRANSMISSION]
+        torrent_dict = await add_urls(urls, torrent_client=torrent_client)
         result: dict[str, dict[str, object] | None] = {
             url: (
                 {
@@ -110,10 +129,12 @@ class HaHHandler(View):
 
         task_manager = self.request.app[TASK_MANAGER]
         uploader = self.request.app[UPLOADER]
+        compressor = self.request.app[COMPRESSOR]
         folders = upload_finished_hah(
             hah_path=Path(ctx.hah_path),
             uploader=uploader,
             task_manager=task_manager,
+            compressor=compressor,
         )
         finished = [folder.name for folder in folders]
         return _json_response(finished)
@@ -141,10 +162,68 @@ class LinksHandler(View):
 
         task_manager = self.request.app[TASK_MANAGER]
         uploader = self.request.app[UPLOADER]
-        task_manager.create(upload_from_url(url, name, uploader=uploader))
+        schedule_upload_from_url(
+            task_manager=task_manager, uploader=uploader, url=url, name=name
+        )
+        return Response(status=204)
+
+
+class JobPriorityData(TypedDict):
+    priority: int
+
+
+class JobsHandler(View):
+    async def get(self):
+        task_manager = self.request.app[TASK_MANAGER]
+        key = self.request.match_info.get("key")
+        if not key:
+            return _json_response([_.to_dict() for _ in task_manager.list_progress()])
+        progress = task_manager.get_progress(key)
+        if not progress:
+            raise HTTPNotFound
+        return _json_response(progress.to_dict())
+
+    async def put(self):
+        key = self.request.match_info.get("key")
+        if not key:
+            raise HTTPBadRequest
+        data: JobPriorityData = await self.request.json()
+        if not data:
+            raise HTTPBadRequest
+        priority = data.get("priority")
+        # bool is an int too
+        if not isinstance(priority, int) or isinstance(priority, bool):
+            raise HTTPBadRequest
+        if priority < 0:
+            raise HTTPBadRequest
+
+        task_manager = self.request.app[TASK_MANAGER]
+        if not task_manager.set_priority(key, priority):
+            raise HTTPNotFound
         return Response(status=204)
 
 
+class JobEventsHandler(View):
+    async def get(self):
+        broadcaster = self.request.app[EVENTS]
+        response = StreamResponse(
+            headers={
+                "Content-Type": "text/event-stream",
+                "Cache-Control": "no-cache",
+            }
+        )
+        await response.prepare(self.request)
+        with broadcaster.subscribe() as queue:
+            while (event := await _next_event(queue)) is not None:
+                try:
+                    async with asyncio.timeout(WRITE_TIMEOUT):
+                        await response.write(event.encode("utf-8"))
+                except (TimeoutError, ConnectionResetError):
+                    _L.info("event stream client went away")
+                    break
+        return response
+
+
 class FilterData(TypedDict):
     regexp: str
 
@@ -152,13 +231,14 @@ class FilterData(TypedDict):
 class FiltersHandler(View):
     async def get(self):
         store = self.request.app[FILTER_STORE]
-        return _json_response([_.to_dict() for _ in store.list()])
+        filters = await asyncio.to_thread(store.list)
+        return _json_response([_.to_dict() for _ in filters])
 
     async def post(self):
         regexp = await self._read_regexp()
         store = self.request.app[FILTER_STORE]
         try:
-            created = store.create(regexp)
+            created = await asyncio.to_thread(store.create, regexp)
         except DuplicateFilterError:
             raise HTTPConflict
         return _json_response(created.to_dict())
@@ -168,7 +248,7 @@ class FiltersHandler(View):
         regexp = await self._read_regexp()
         store = self.request.app[FILTER_STORE]
         try:
-            updated = store.update(id_, regexp)
+            updated = await asyncio.to_thread(store.update, id_, regexp)
         except DuplicateFilterError:
             raise HTTPConflict
         except FilterNotFoundError:
@@ -179,7 +259,7 @@ class FiltersHandler(View):
         id_ = self._read_id()
         store = self.request.app[FILTER_STORE]
         try:
-            store.delete(id_)
+            await asyncio.to_thread(store.delete, id_)
         except FilterNotFoundError:
             raise HTTPNotFound
         return Response(status=204)
@@ -205,6 +285,14 @@ class FiltersHandler(View):
         return regexp
 
 
+async def _next_event(queue: asyncio.Queue[str | None]) -> str | None:
+    try:
+        async with asyncio.timeout(KEEPALIVE_INTERVAL):
+            return await queue.get()
+    except TimeoutError:
+        return ": keepalive\n\n"
+
+
 def _json_response(data: object) -> Response:
     result = json.dumps(data)
     result = result + "\n"
@@ -1,15 +1,26 @@
+import asyncio
+import logging
 import re
 from abc import ABCMeta, abstractmethod
-from collections.abc import Iterable
+from collections.abc import Iterable, Sequence
 from contextlib import asynccontextmanager
+from pathlib import PurePosixPath
 from typing import override
 
 from .filters import FilterStore, create_filter_store
 from .settings import ExcludeData
 
 
+POLL_INTERVAL = 5
+_L = logging.getLogger(__name__)
+
+# \1 or (?(1)...) in a filter, they mean another group once merged.
+_NUMBERED_REFERENCE = re.compile(r"\\[1-9]|\(\?\(\d")
+
 type _Filter = re.Pattern[str]
 type FilterList = list[_Filter]
+# Folder name to children, files map to None.
+type PathTree = dict[str, PathTree | None]
 
 
 class DfdClient(metaclass=ABCMeta):
@@ -19,22 +30,63 @@ class DfdClient(metaclass=ABCMeta):
 
 
 @asynccontextmanager
-async def create_dfd_client(exclude_data: ExcludeData | None):
+async def create_dfd_client(
+    exclude_data: ExcludeData | None, *, store: FilterStore | None = None
+):
     if not exclude_data:
         yield _StaticDfdClient(static=[])
         return
     static = _to_regex_list(exclude_data.static if exclude_data.static else [])
     if not exclude_data.dynamic:
-        yield _StaticDfdClient(static=static)
+        yield _StaticDfdClient(static=_combine(static))
+        return
+    if store:
+        async with _watch_store(static=static, store=store) as client:
+            yield client
         return
     store = create_filter_store(exclude_data.dynamic)
-    yield _DefaultDfdClient(static=static, store=store)
+    try:
+        async with _watch_store(static=static, store=store) as client:
+            yield client
+    finally:
+        store.close()
 
 
 def should_exclude(name: str, exclude_list: FilterList) -> bool:
     return any(_.match(name) is not None for _ in exclude_list)
 
 
+def prune_paths(paths: Iterable[str], exclude_list: FilterList) -> PathTree:
+    """
+    Builds a tree from relative file paths, leaving out everything a filter
+    matches by name or by relative path. Each folder is checked once, and
+    nothing under an excluded folder is checked at all.
+    """
+    root: PathTree = {}
+    excluded: set[PurePosixPath] = set()
+    for raw in sorted(set(paths)):
+        path = PurePosixPath(raw)
+        node = root
+        parents = path.parents[-2::-1]
+        for part in parents:
+            if part in excluded:
+                break
+            if part.name not in node:
+                if _should_exclude_path(part, exclude_list):
+                    excluded.add(part)
+                    break
+                node[part.name] = {}
+            child = node[part.name]
+            if child is None:
+                # Already seen as a file, the path list is inconsistent.
+                break
+            node = child
+        else:
+            if path.name not in node and not _should_exclude_path(path, exclude_list):
+                node[path.name] = None
+    return root
+
+
 class _StaticDfdClient(DfdClient):
     def __init__(self, *, static: FilterList) -> None:
         self._const = static
@@ -45,14 +97,52 @@ class _StaticDfdClient(DfdClient):
 
 
 class _DefaultDfdClient(DfdClient):
-    def __init__(self, *, static: FilterList, store: FilterStore) -> None:
+    """
+    Holds the compiled filters in memory. The store pushes the new list on
+    every write, so fetching never touches the database.
+    """
+
+    def __init__(self, *, static: FilterList, regexps: Iterable[str]) -> None:
         self._const = static
-        self._store = store
+        self._filters = _combine(self._const + _to_regex_list(regexps))
 
     @override
     async def fetch_filters(self) -> FilterList:
-        rv = _to_regex_list(self._store.regexps())
-        return self._const + rv
+        return self._filters
+
+    def reload(self, regexps: Sequence[str]) -> None:
+        # Called from worker threads, swapping the list is atomic.
+        self._filters = _combine(self._const + _to_regex_list(regexps))
+
+
+@asynccontextmanager
+async def _watch_store(*, static: FilterList, store: FilterStore):
+    regexps = await asyncio.to_thread(store.regexps)
+    client = _DefaultDfdClient(static=static, regexps=regexps)
+    store.add_listener(client.reload)
+    # Other tools may edit the database too.
+    task = asyncio.create_task(_poll_store(store))
+    try:
+        yield client
+    finally:
+        task.cancel()
+        store.remove_listener(client.reload)
+
+
+async def _poll_store(store: FilterStore) -> None:
+    while True:
+        await asyncio.sleep(POLL_INTERVAL)
+        try:
+            if await asyncio.to_thread(store.refresh):
+                _L.info("reloaded filters changed by another process")
+        except Exception:
+            _L.exception("cannot check filter changes")
+
+
+def _should_exclude_path(path: PurePosixPath, exclude_list: FilterList) -> bool:
+    return should_exclude(path.name, exclude_list) or should_exclude(
+        str(path), exclude_list
+    )
 
 
 def _to_regex_list(raw_regex_iter: Iterable[str]) -> FilterList:
@@ -61,6 +151,22 @@ def _to_regex_list(raw_regex_iter: Iterable[str]) -> FilterList:
     return [_ for _ in maybe_regex if _]
 
 
+def _combine(filters: FilterList) -> FilterList:
+    """
+    Merges filters into one alternation so a name is scanned once. Filters
+    that refer to a group by number stay apart, merging would shift it; so
+    do all of them if they cannot live in one regex, e.g. duplicate group
+    names.
+    """
+    mergeable = [_ for _ in filters if not _NUMBERED_REFERENCE.search(_.pattern)]
+    if len(mergeable) < 2:
+        return filters
+    merged = _to_pattern("|".join(f"(?:{_.pattern})" for _ in mergeable))
+    if not merged:
+        return filters
+    return [merged, *(_ for _ in filters if _ not in mergeable)]
+
+
 def _to_pattern(pattern: str) -> _Filter | None:
     try:
         return re.compile(pattern, re.I)
@@ -0,0 +1,123 @@
+import asyncio
+import json
+import logging
+from collections.abc import Callable, Iterable
+from contextlib import contextmanager
+
+from .progress import JobProgress
+
+
+# Progress is sampled this often, changes in between are merged.
+EVENT_INTERVAL = 1
+# Events a client may fall behind by before it is dropped.
+QUEUE_SIZE = 8
+_L = logging.getLogger(__name__)
+
+# Throughput and ETA change on every read, they only go out with these.
+_TRACKED = (
+    "state",
+    "phase",
+    "bytes_done",
+    "bytes_total",
+    "files_done",
+    "files_total",
+)
+
+type _Job = dict[str, object]
+type _Queue = asyncio.Queue[str | None]
+
+
+class ProgressBroadcaster:
+    """
+    Sends job progress to event stream clients. New clients get a snapshot
+    of every job, then at most one event per interval with the jobs that
+    changed and the ones that ended.
+
+    Publishing never waits for a client; one that does not keep up is
+    dropped instead.
+    """
+
+    def __init__(
+        self,
+        source: Callable[[], Iterable[JobProgress]],
+        *,
+        interval: float = EVENT_INTERVAL,
+        queue_size: int = QUEUE_SIZE,
+    ) -> None:
+        self._source = source
+        self._interval = interval
+        self._queue_size = queue_size
+        self._last: dict[str, _Job] = {}
+        self._queues = set[_Queue]()
+        self._closed = False
+
+    async def run(self) -> None:
+        while True:
+            await asyncio.sleep(self._interval)
+            if self._queues:
+                self.publish()
+
+    def close(self) -> None:
+        """
+        Ends every stream, so shutdown does not wait for clients.
+        """
+        self._closed = True
+        for queue in list(self._queues):
+            self._drop(queue)
+
+    @contextmanager
+    def subscribe(self):
+        if not self._queues:
+            # Nothing was tracked while nobody listened.
+            self._last = self._collect()
+        queue: _Queue = asyncio.Queue(maxsize=self._queue_size)
+        if self._closed:
+            queue.put_nowait(None)
+        else:
+            snapshot = {"jobs": [*self._last.values()]}
+            queue.put_nowait(_format_event("snapshot", snapshot))
+            self._queues.add(queue)
+        try:
+            yield queue
+        finally:
+            self._queues.discard(queue)
+
+    def publish(self) -> None:
+        current = self._collect()
+        changed = [
+            job
+            for name, job in current.items()
+            if _is_changed(self._last.get(name), job)
+        ]
+        removed = [_ for _ in self._last if _ not in current]
+        self._last = current
+        if not changed and not removed:
+            return
+
+        event = _format_event("progress", {"jobs": changed, "removed": removed})
+        for queue in list(self._queues):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                _L.warning("dropped a slow event stream client")
+                self._drop(queue)
+
+    def _collect(self) -> dict[str, _Job]:
+        return {_.name: _.to_dict() for _ in self._source()}
+
+    def _drop(self, queue: _Queue) -> None:
+        self._queues.discard(queue)
+        # Skip the backlog, the client has to reconnect for a new snapshot.
+        while not queue.empty():
+            queue.get_nowait()
+        queue.put_nowait(None)
+
+
+def _is_changed(old: _Job | None, new: _Job) -> bool:
+    if old is None:
+        return True
+    return any(old[_] != new[_] for _ in _TRACKED)
+
+
+def _format_event(name: str, data: object) -> str:
+    return f"event: {name}\ndata: {json.dumps(data)}\n\n"
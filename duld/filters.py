@@ -1,6 +1,6 @@
 import sqlite3
-from collections.abc import Iterable
-from contextlib import closing
+import threading
+from collections.abc import Callable, Sequence
 from dataclasses import dataclass
 from pathlib import Path
 
@@ -26,13 +26,49 @@ class FilterData:
         return {"id": self.id, "regexp": self.regexp}
 
 
+type FilterListener = Callable[[Sequence[str]], None]
+
+
 class FilterStore:
+    """
+    Keeps one connection open for the lifetime of the daemon. Methods block,
+    async callers should run them in a thread; the lock serializes them.
+
+    Listeners get the full list of regexps after every write, and after
+    `refresh` sees a commit from another process.
+    """
+
     def __init__(self, path: Path) -> None:
         self._path = path
+        self._lock = threading.Lock()
+        self._conn: sqlite3.Connection | None = None
+        self._listeners: list[FilterListener] = []
+        self._data_version: int | None = None
+
+    def add_listener(self, listener: FilterListener) -> None:
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener: FilterListener) -> None:
+        self._listeners.remove(listener)
+
+    def refresh(self) -> bool:
+        """
+        Notifies listeners if another connection changed the database since
+        the last call. Returns whether it did.
+        """
+        with self._lock:
+            conn = self._connect()
+            (data_version,) = conn.execute("PRAGMA data_version").fetchone()
+            if data_version == self._data_version:
+                return False
+            self._data_version = data_version
+            self._notify(conn)
+            return True
 
     def init(self) -> None:
         self._path.parent.mkdir(parents=True, exist_ok=True)
-        with closing(self._connect()) as conn:
+        with self._lock:
+            conn = self._connect()
             with conn:
                 conn.execute(
                     """
@@ -42,15 +78,24 @@ class FilterStore:
                     )
                     """
                 )
+            (self._data_version,) = conn.execute("PRAGMA data_version").fetchone()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn:
+                self._conn.close()
+                self._conn = None
 
     def list(self) -> list[FilterData]:
-        with closing(self._connect()) as conn:
+        with self._lock:
+            conn = self._connect()
             rows = conn.execute("SELECT id, regexp FROM filters ORDER BY id").fetchall()
         return [_to_filter_data(_) for _ in rows]
 
     def create(self, regexp: str) -> FilterData:
-        try:
-            with closing(self._connect()) as conn:
+        with self._lock:
+            conn = self._connect()
+            try:
                 with conn:
                     cursor = conn.execute(
                         "INSERT INTO filters (regexp) VALUES (?)",
@@ -60,14 +105,17 @@ class FilterStore:
                         "SELECT id, regexp FROM filters WHERE id = ?",
                         (cursor.lastrowid,),
                     ).fetchone()
-        except sqlite3.IntegrityError as e:
-            raise DuplicateFilterError from e
+            except sqlite3.IntegrityError as e:
+                raise DuplicateFilterError from e
+            # Only after the commit, listeners may read the table themselves.
+            self._notify(conn)
         assert row is not None
         return _to_filter_data(row)
 
     def update(self, id_: int, regexp: str) -> FilterData:
-        try:
-            with closing(self._connect()) as conn:
+        with self._lock:
+            conn = self._connect()
+            try:
                 with conn:
                     cursor = conn.execute(
                         "UPDATE filters SET regexp = ? WHERE id = ?",
@@ -79,24 +127,42 @@ class FilterStore:
                         "SELECT id, regexp FROM filters WHERE id = ?",
                         (id_,),
                     ).fetchone()
-        except sqlite3.IntegrityError as e:
-            raise DuplicateFilterError from e
+            except sqlite3.IntegrityError as e:
+                raise DuplicateFilterError from e
+            self._notify(conn)
         assert row is not None
         return _to_filter_data(row)
 
     def delete(self, id_: int) -> None:
-        with closing(self._connect()) as conn:
+        with self._lock:
+            conn = self._connect()
             with conn:
                 cursor = conn.execute("DELETE FROM filters WHERE id = ?", (id_,))
                 if cursor.rowcount == 0:
                     raise FilterNotFoundError
+            self._notify(conn)
+
+    def regexps(self) -> Sequence[str]:
+        return [_.regexp for _ in self.list()]
 
-    def regexps(self) -> Iterable[str]:
-        return (_.regexp for _ in self.list())
+    def _notify(self, conn: sqlite3.Connection) -> None:
+        if not self._listeners:
+            return
+        rows = conn.execute("SELECT regexp FROM filters ORDER BY id").fetchall()
+        regexps = [_["regexp"] for _ in rows]
+        for listener in self._listeners:
+            listener(regexps)
 
     def _connect(self) -> sqlite3.Connection:
-        conn = sqlite3.connect(self._path)
+        # Reusing the connection also reuses its prepared statement cache.
+        if self._conn:
+            return self._conn
+        conn = sqlite3.connect(self._path, check_same_thread=False)
         conn.row_factory = sqlite3.Row
+        # Readers do not wait for writers, and commits skip most fsyncs.
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn = conn
         return conn
 
 
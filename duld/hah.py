@@ -2,12 +2,12 @@ import logging
 import re
 import shutil
 from pathlib import Path
-from tempfile import TemporaryDirectory
 from typing import cast
 
 from asyncinotify import Event, Mask, RecursiveWatcher
 
-from .lib import compress_to_path, is_too_long_to_compress
+from .lib import Compressor, is_too_long_to_compress
+from .progress import current_progress
 from .tasks import UploadTaskManager
 from .upload import Uploader
 
@@ -23,6 +23,7 @@ async def watch_finished_hah(
     hah_path: Path,
     uploader: Uploader,
     task_manager: UploadTaskManager,
+    compressor: Compressor,
 ) -> None:
     download_path = hah_path / "download"
 
@@ -37,12 +38,17 @@ async def watch_finished_hah(
             schedule_upload_hah(
                 task_manager=task_manager,
                 uploader=uploader,
+                compressor=compressor,
                 src_path=gallery_path,
             )
 
 
 def upload_finished_hah(
-    *, hah_path: Path, uploader: Uploader, task_manager: UploadTaskManager
+    *,
+    hah_path: Path,
+    uploader: Uploader,
+    task_manager: UploadTaskManager,
+    compressor: Compressor,
 ) -> list[Path]:
     download_path = hah_path / "download"
 
@@ -53,6 +59,7 @@ def upload_finished_hah(
             schedule_upload_hah(
                 task_manager=task_manager,
                 uploader=uploader,
+                compressor=compressor,
                 src_path=candidate,
             )
             finished.append(candidate)
@@ -63,35 +70,42 @@ def schedule_upload_hah(
     *,
     task_manager: UploadTaskManager,
     uploader: Uploader,
+    compressor: Compressor,
     src_path: Path,
 ) -> bool:
     key = ("hah", src_path.resolve())
-    accepted = task_manager.create_once(key, lambda: _upload(uploader, src_path))
+    accepted = task_manager.create_once(
+        key,
+        lambda: _upload(uploader, compressor, src_path),
+        args={"path": str(src_path)},
+    )
     if not accepted:
         _L.warning(f"{src_path} is still uploading")
     return accepted
 
 
-async def _upload(uploader: Uploader, src_path: Path) -> None:
+async def _upload(uploader: Uploader, compressor: Compressor, src_path: Path) -> None:
     if not src_path.exists():
         _L.info(f"hah ignored deleted path: {src_path}")
         return
 
-    with TemporaryDirectory() as tmp:
+    with compressor.temporary_directory() as tmp:
         work_path = Path(tmp)
 
         try:
             compress_base_name, remote_name = _get_names_for_upload(src_path, work_path)
 
             _L.info(f"compressing {src_path} to {work_path} ...")
-            tmp_path = await compress_to_path(
-                src_path, work_path, base_name=compress_base_name
+            current_progress().phase = "compressing"
+            tmp_path = await compressor.compress(
+                src_path, work_path, base_name=compress_base_name, kind="hah"
             )
 
             _L.info(f"hah upload {tmp_path}")
             await uploader.upload_from_hah(tmp_path, remote_name=remote_name)
         except Exception:
             _L.exception(f"trying to upload {src_path} but failed")
+            current_progress().fail()
             return
 
     # clean up
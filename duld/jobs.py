@@ -0,0 +1,168 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Literal
+
+
+# Writes are committed together after this delay, so a burst of jobs costs one
+# fsync instead of one each.
+COMMIT_DELAY = 0.5
+# Jobs interrupted by a crash this many times are dropped instead of replayed.
+MAX_ATTEMPTS = 3
+_L = logging.getLogger(__name__)
+
+type JobArgs = dict[str, Any]
+type JobState = Literal["pending", "running"]
+
+
+@dataclass(frozen=True)
+class JobData:
+    key: str
+    kind: str
+    args: JobArgs
+    state: JobState
+    attempts: int
+
+
+class JobStore:
+    """
+    Durable record of scheduled upload jobs, so they survive a restart.
+
+    Changes are buffered in memory and written in one transaction by
+    `flush`; `create_job_store` calls it shortly after every change. Methods
+    block, the lock makes them safe to call from worker threads.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self._path = path
+        self._lock = threading.Lock()
+        self._conn: sqlite3.Connection | None = None
+        self._buffer: list[tuple[str, tuple[Any, ...]]] = []
+        self._dirty = asyncio.Event()
+        # Set by create_job_store, the flusher runs there.
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    def init(self) -> None:
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                conn.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS jobs (
+                        key TEXT PRIMARY KEY,
+                        kind TEXT NOT NULL,
+                        args TEXT NOT NULL,
+                        state TEXT NOT NULL,
+                        attempts INTEGER NOT NULL DEFAULT 0
+                    )
+                    """
+                )
+
+    def close(self) -> None:
+        self.flush()
+        with self._lock:
+            if self._conn:
+                self._conn.close()
+                self._conn = None
+
+    def list(self) -> list[JobData]:
+        with self._lock:
+            conn = self._connect()
+            rows = conn.execute(
+                "SELECT key, kind, args, state, attempts FROM jobs ORDER BY rowid"
+            ).fetchall()
+        return [_to_job_data(_) for _ in rows]
+
+    def put(self, key: str, kind: str, args: JobArgs) -> None:
+        # Scheduling a known job again keeps its attempts.
+        self._write(
+            """
+            INSERT INTO jobs (key, kind, args, state) VALUES (?, ?, ?, 'pending')
+            ON CONFLICT (key) DO UPDATE SET args = excluded.args, state = 'pending'
+            """,
+            (key, kind, json.dumps(args)),
+        )
+
+    def start(self, key: str) -> None:
+        self._write(
+            "UPDATE jobs SET state = 'running', attempts = attempts + 1 WHERE key = ?",
+            (key,),
+        )
+
+    def requeue(self, key: str) -> None:
+        """
+        Puts back a job stopped on purpose, without counting the attempt.
+        """
+        self._write(
+            "UPDATE jobs SET state = 'pending', attempts = attempts - 1 WHERE key = ?",
+            (key,),
+        )
+
+    def remove(self, key: str) -> None:
+        self._write("DELETE FROM jobs WHERE key = ?", (key,))
+
+    def flush(self) -> None:
+        with self._lock:
+            buffer, self._buffer = self._buffer, []
+            if not buffer:
+                return
+            conn = self._connect()
+            with conn:
+                for sql, params in buffer:
+                    conn.execute(sql, params)
+
+    def _write(self, sql: str, params: tuple[Any, ...]) -> None:
+        with self._lock:
+            self._buffer.append((sql, params))
+        if self._loop:
+            # asyncio.Event is not thread-safe, writers may be worker threads.
+            self._loop.call_soon_threadsafe(self._dirty.set)
+
+    async def _flush_forever(self) -> None:
+        while True:
+            await self._dirty.wait()
+            await asyncio.sleep(COMMIT_DELAY)
+            self._dirty.clear()
+            try:
+                await asyncio.to_thread(self.flush)
+            except Exception:
+                _L.exception("cannot save jobs")
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn:
+            return self._conn
+        conn = sqlite3.connect(self._path, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn = conn
+        return conn
+
+
+@asynccontextmanager
+async def create_job_store(path: str):
+    store = JobStore(Path(path))
+    await asyncio.to_thread(store.init)
+    store._loop = asyncio.get_running_loop()
+    task = asyncio.create_task(store._flush_forever())
+    try:
+        yield store
+    finally:
+        task.cancel()
+        await asyncio.to_thread(store.close)
+
+
+def _to_job_data(row: sqlite3.Row) -> JobData:
+    return JobData(
+        key=row["key"],
+        kind=row["kind"],
+        args=json.loads(row["args"]),
+        state=row["state"],
+        attempts=row["attempts"],
+    )
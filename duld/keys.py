@@ -2,9 +2,12 @@ from asyncio import TaskGroup
 
 from aiohttp.web import AppKey
 
+from .events import ProgressBroadcaster
 from .filters import FilterStore
+from .lib import Compressor
 from .settings import Data
 from .tasks import UploadTaskManager
+from .transmission import TransmissionClient
 from .upload import Uploader
 
 
@@ -13,3 +16,6 @@ FILTER_STORE = AppKey("FILTER_STORE", FilterStore)
 UPLOADER = AppKey("UPLOADER", Uploader)
 SCHEDULER = AppKey("SCHEDULER", TaskGroup)
 TASK_MANAGER = AppKey("TASK_MANAGER", UploadTaskManager)
+TRANSMISSION = AppKey("TRANSMISSION", TransmissionClient)
+COMPRESSOR = AppKey("COMPRESSOR", Compressor)
+EVENTS = AppKey("EVENTS", ProgressBroadcaster)
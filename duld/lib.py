@@ -1,20 +1,151 @@
+import asyncio
+import os
+from itertools import islice
+from logging import getLogger
 from pathlib import Path
+from tempfile import TemporaryDirectory
 
+from .settings import CompressData, CompressProfile
 
-async def compress_to_path(src_path: Path, dst_path: Path, *, base_name: str) -> Path:
+
+_L = getLogger(__name__)
+
+_PROFILE_ARGS: dict[CompressProfile, list[str]] = {
+    "store": ["-mx0"],
+    "fast": ["-mx1"],
+    "default": [],
+}
+# Formats that do not shrink any further with LZMA.
+_COMPRESSED_SUFFIXES = frozenset(
+    [
+        ".jpg",
+        ".jpeg",
+        ".png",
+        ".gif",
+        ".webp",
+        ".avif",
+        ".jxl",
+        ".heic",
+        ".mp4",
+        ".mkv",
+        ".webm",
+        ".mov",
+        ".mp3",
+        ".m4a",
+        ".flac",
+        ".ogg",
+        ".opus",
+        ".zip",
+        ".7z",
+        ".rar",
+        ".gz",
+        ".xz",
+        ".zst",
+    ]
+)
+_SAMPLE_FILES = 64
+_COMPRESSED_RATIO = 0.9
+
+
+class Compressor:
+    """
+    Daemon-wide queue of 7z processes.
+
+    At most `max_jobs` processes run at once, each with `threads` threads, so
+    H@H galleries and torrent folders together do not oversubscribe the CPU.
+    """
+
+    def __init__(
+        self,
+        *,
+        max_jobs: int,
+        threads: int,
+        profiles: dict[str, CompressProfile] | None = None,
+        work_dir: Path | None = None,
+    ) -> None:
+        self._lock = asyncio.Semaphore(max_jobs)
+        self._threads = threads
+        self._profiles = profiles or {}
+        self._work_dir = work_dir
+        self._waiting = 0
+
+    @property
+    def queue_depth(self) -> int:
+        return self._waiting
+
+    def temporary_directory(self) -> TemporaryDirectory[str]:
+        """
+        Scratch space for archives, removed after use.
+        """
+        return TemporaryDirectory(dir=self._work_dir)
+
+    async def compress(
+        self, src_path: Path, dst_path: Path, *, base_name: str, kind: str
+    ) -> Path:
+        """
+        `kind` is the job source (hah, torrent) and picks the profile.
+        """
+        profile = self._profiles.get(kind, "default")
+        self._waiting += 1
+        try:
+            if self._lock.locked():
+                _L.info(f"compress queued, {self._waiting} waiting: {src_path}")
+            await self._lock.acquire()
+        finally:
+            self._waiting -= 1
+        try:
+            return await compress_to_path(
+                src_path,
+                dst_path,
+                base_name=base_name,
+                threads=self._threads,
+                profile=profile,
+            )
+        finally:
+            self._lock.release()
+
+
+def create_compressor(data: CompressData | None) -> Compressor:
+    threads = data.threads if data and data.threads else (os.cpu_count() or 1)
+    max_jobs = data.max_jobs if data and data.max_jobs else min(2, threads)
+    profiles: dict[str, CompressProfile] = {}
+    if data and data.hah:
+        profiles["hah"] = data.hah
+    if data and data.torrent:
+        profiles["torrent"] = data.torrent
+    work_dir = Path(data.work_dir) if data and data.work_dir else None
+    return Compressor(
+        max_jobs=max_jobs,
+        threads=max(1, threads // max_jobs),
+        profiles=profiles,
+        work_dir=work_dir,
+    )
+
+
+async def compress_to_path(
+    src_path: Path,
+    dst_path: Path,
+    *,
+    base_name: str,
+    threads: int | None = None,
+    profile: CompressProfile = "default",
+) -> Path:
     from asyncio import create_subprocess_exec
     from asyncio.subprocess import DEVNULL
 
     name = f"{base_name}.7z"
     out_path = dst_path / name
 
-    cmd = [
-        "7zr",
-        "a",
-        "-y",
-        str(out_path),
-        "*",
-    ]
+    cmd = ["7zr", "a", "-y"]
+    if threads:
+        cmd.append(f"-mmt{threads}")
+    if profile == "auto":
+        # Walks the folder, keep it off the loop.
+        compressed = await asyncio.to_thread(is_compressed_content, src_path)
+        profile = "store" if compressed else "default"
+        _L.debug(f"compress profile {profile}: {src_path}")
+    cmd += _PROFILE_ARGS[profile]
+    cmd += [str(out_path), "*"]
     p = await create_subprocess_exec(
         *cmd, cwd=str(src_path), stdin=DEVNULL, stdout=DEVNULL, stderr=DEVNULL
     )
@@ -26,6 +157,22 @@ async def compress_to_path(src_path: Path, dst_path: Path, *, base_name: str) ->
     return out_path
 
 
+def is_compressed_content(src_path: Path) -> bool:
+    """
+    Samples the first files under src_path, returns True if most of the bytes
+    are in already compressed formats.
+    """
+    file_list = (_ for _ in src_path.rglob("*") if _.is_file())
+    total = 0
+    compressed = 0
+    for path in islice(file_list, _SAMPLE_FILES):
+        size = path.stat().st_size
+        total += size
+        if path.suffix.lower() in _COMPRESSED_SUFFIXES:
+            compressed += size
+    return total > 0 and compressed >= total * _COMPRESSED_RATIO
+
+
 def is_too_long_to_compress(dst_path: Path, base_name: str) -> bool:
     name = f"{base_name}.7z"
     out_path = dst_path / name
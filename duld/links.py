@@ -1,15 +1,42 @@
+import time
 from logging import getLogger
 from pathlib import Path
 from tempfile import TemporaryDirectory
+from typing import BinaryIO
 
-from aiohttp import ClientSession
+from aiohttp import ClientError, ClientResponse, ClientSession
 
+from .tasks import UploadTaskManager
 from .upload import Uploader
 
 
+RETRY_TIMES = 3
+_CHUNK_SIZE = 256 * 1024
+_PROGRESS_INTERVAL = 10
 _L = getLogger(__name__)
 
 
+class DownloadError(Exception):
+    pass
+
+
+def schedule_upload_from_url(
+    *,
+    task_manager: UploadTaskManager,
+    uploader: Uploader,
+    url: str,
+    name: str | None,
+) -> bool:
+    accepted = task_manager.create_once(
+        ("link", url),
+        lambda: upload_from_url(url, name, uploader=uploader),
+        args={"url": url, "name": name},
+    )
+    if not accepted:
+        _L.warning(f"{url} is still downloading")
+    return accepted
+
+
 async def upload_from_url(url: str, name: str | None, /, *, uploader: Uploader) -> None:
     if not name:
         name = url.split("/")[-1]
@@ -17,7 +44,69 @@ async def upload_from_url(url: str, name: str | None, /, *, uploader: Uploader)
         path = Path(tmpdir) / name
         _L.debug(f"downloading {url} to {path}")
         async with ClientSession() as session:
-            async with session.get(url) as resp:
-                with path.open("wb") as f:
-                    f.write(await resp.read())
+            await download_retry(session, url, path)
         await uploader.upload_from_path(path)
+
+
+async def download_retry(session: ClientSession, url: str, path: Path) -> None:
+    """
+    Streams url into path. An interrupted download resumes from the bytes
+    already on disk if the server supports range requests.
+    """
+    for _ in range(RETRY_TIMES):
+        try:
+            await _download(session, url, path)
+            return
+        except (ClientError, TimeoutError):
+            _L.exception(f"retry download {url}")
+    raise DownloadError(f"tried download {RETRY_TIMES} times")
+
+
+async def _download(session: ClientSession, url: str, path: Path) -> None:
+    offset = path.stat().st_size if path.exists() else 0
+    headers = {"Range": f"bytes={offset}-"} if offset else None
+
+    async with session.get(url, headers=headers) as resp:
+        if offset and resp.status == 416:
+            # Range not satisfiable: nothing left to fetch.
+            return
+        resp.raise_for_status()
+
+        if resp.status != 206:
+            # The server ignored the range, start over.
+            offset = 0
+        total = _get_total_size(resp, offset)
+
+        with path.open("ab" if offset else "wb") as fout:
+            await _write_body(resp, fout, offset=offset, total=total, url=url)
+
+
+async def _write_body(
+    resp: ClientResponse, fout: BinaryIO, *, offset: int, total: int | None, url: str
+) -> None:
+    done = offset
+    last_done = done
+    last_time = time.monotonic()
+    async for chunk in resp.content.iter_chunked(_CHUNK_SIZE):
+        fout.write(chunk)
+        done += len(chunk)
+
+        now = time.monotonic()
+        elapsed = now - last_time
+        if elapsed >= _PROGRESS_INTERVAL:
+            rate = (done - last_done) / elapsed
+            _L.info(f"downloading {url}: {done}/{total or '?'} bytes, {rate:.0f} B/s")
+            last_done = done
+            last_time = now
+
+    if total is not None and done < total:
+        raise ClientError(f"incomplete body: {done}/{total} bytes")
+
+
+def _get_total_size(resp: ClientResponse, offset: int) -> int | None:
+    if resp.content_length is None:
+        return None
+    if "Content-Encoding" in resp.headers:
+        # Content-Length is the encoded size, not what we write.
+        return None
+    return offset + resp.content_length
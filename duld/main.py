@@ -1,7 +1,7 @@
 import logging
 import signal
 from argparse import ArgumentDefaultsHelpFormatter, ArgumentParser
-from asyncio import Event, TaskGroup, get_running_loop
+from asyncio import Event, TaskGroup, get_running_loop, to_thread
 from collections.abc import Coroutine
 from contextlib import AsyncExitStack, asynccontextmanager
 from pathlib import Path
@@ -9,13 +9,34 @@ from pathlib import Path
 from aiohttp.web import Application, AppRunner, TCPSite
 from wcpan.logging import ConfigBuilder
 
-from .api import FiltersHandler, HaHHandler, LinksHandler, TorrentsHandler
+from .api import (
+    FiltersHandler,
+    HaHHandler,
+    JobEventsHandler,
+    JobsHandler,
+    LinksHandler,
+    TorrentsHandler,
+)
+from .events import ProgressBroadcaster
 from .filters import create_filter_store
-from .hah import watch_finished_hah
-from .keys import CONTEXT, FILTER_STORE, SCHEDULER, TASK_MANAGER, UPLOADER
+from .hah import schedule_upload_hah, watch_finished_hah
+from .jobs import MAX_ATTEMPTS, JobStore, create_job_store
+from .keys import (
+    COMPRESSOR,
+    CONTEXT,
+    EVENTS,
+    FILTER_STORE,
+    SCHEDULER,
+    TASK_MANAGER,
+    TRANSMISSION,
+    UPLOADER,
+)
+from .lib import create_compressor
+from .links import schedule_upload_from_url
 from .settings import load_from_path
 from .tasks import UploadTaskManager
-from .torrent import watch_disk_space
+from .torrent import schedule_upload_by_id, watch_disk_space
+from .transmission import create_transmission_client
 from .upload import create_uploader
 
 
@@ -62,23 +83,67 @@ class Daemon:
         if self._cfg.hah_path:
             app.router.add_view(r"/api/v1/hah", HaHHandler)
         app.router.add_view(r"/api/v1/links", LinksHandler)
+        app.router.add_view(r"/api/v1/jobs", JobsHandler)
+        # Before the key route, which would take it as a job name.
+        app.router.add_view(r"/api/v1/jobs/events", JobEventsHandler)
+        app.router.add_view(r"/api/v1/jobs/{key:.+}", JobsHandler)
         if self._cfg.exclude and self._cfg.exclude.dynamic:
             app.router.add_view(r"/api/v1/filters", FiltersHandler)
             app.router.add_view(r"/api/v1/filters/{filter_id:\d+}", FiltersHandler)
 
         async with AsyncExitStack() as stack:
             app[CONTEXT] = self._cfg
+            filter_store = None
             if self._cfg.exclude and self._cfg.exclude.dynamic:
-                app[FILTER_STORE] = create_filter_store(self._cfg.exclude.dynamic)
+                filter_store = create_filter_store(self._cfg.exclude.dynamic)
+                stack.callback(filter_store.close)
+                app[FILTER_STORE] = filter_store
+
+            # Entered before the task group, so it outlives every job.
+            job_store = None
+            if self._cfg.job_queue:
+                job_store = await stack.enter_async_context(
+                    create_job_store(self._cfg.job_queue)
+                )
 
             group = await stack.enter_async_context(TaskGroup())
             app[SCHEDULER] = group
-            task_manager = UploadTaskManager(group)
+            task_manager = UploadTaskManager(
+                group,
+                store=job_store,
+                max_jobs=self._cfg.max_jobs or 0,
+                weights=self._cfg.job_weights,
+            )
             app[TASK_MANAGER] = task_manager
 
-            uploader = await stack.enter_async_context(create_uploader(self._cfg))
+            broadcaster = ProgressBroadcaster(task_manager.list_progress)
+            app[EVENTS] = broadcaster
+            app.on_shutdown.append(_close_events)
+            await stack.enter_async_context(_background(group, broadcaster.run()))
+
+            compressor = create_compressor(self._cfg.compress)
+            app[COMPRESSOR] = compressor
+
+            uploader = await stack.enter_async_context(
+                create_uploader(
+                    self._cfg, compressor=compressor, filter_store=filter_store
+                )
+            )
             app[UPLOADER] = uploader
 
+            if self._cfg.transmission:
+                torrent_client = await stack.enter_async_context(
+                    create_transmission_client(self._cfg.transmission)
+                )
+                app[TRANSMISSION] = torrent_client
+
+            # Exits before the uploader and the Transmission client, so jobs
+            # are stopped and kept instead of failing against closed ones.
+            stack.push_async_callback(task_manager.close)
+
+            if job_store:
+                await _resume_jobs(app, job_store)
+
             if self._cfg.hah_path:
                 await stack.enter_async_context(
                     _background(
@@ -87,6 +152,7 @@ class Daemon:
                             hah_path=Path(self._cfg.hah_path),
                             uploader=uploader,
                             task_manager=task_manager,
+                            compressor=compressor,
                         ),
                     )
                 )
@@ -96,7 +162,7 @@ class Daemon:
                     _background(
                         group,
                         watch_disk_space(
-                            transmission=self._cfg.transmission,
+                            torrent_client=app[TRANSMISSION],
                             disk_space=self._cfg.reserved_space_in_gb,
                         ),
                     )
@@ -120,6 +186,50 @@ class Daemon:
         await self._finished.wait()
 
 
+async def _close_events(app: Application) -> None:
+    # Open streams would hold up the server shutdown.
+    app[EVENTS].close()
+
+
+async def _resume_jobs(app: Application, store: JobStore) -> None:
+    cfg = app[CONTEXT]
+    task_manager = app[TASK_MANAGER]
+    uploader = app[UPLOADER]
+    for job in await to_thread(store.list):
+        if job.attempts >= MAX_ATTEMPTS:
+            _L.error(f"dropped job after {job.attempts} attempts: {job.key}")
+            store.remove(job.key)
+            continue
+
+        _L.info(f"resuming job {job.key}")
+        match job.kind:
+            case "torrent" if cfg.transmission:
+                schedule_upload_by_id(
+                    task_manager=task_manager,
+                    uploader=uploader,
+                    transmission=cfg.transmission,
+                    torrent_client=app[TRANSMISSION],
+                    torrent_id=job.args["torrent_id"],
+                )
+            case "hah":
+                schedule_upload_hah(
+                    task_manager=task_manager,
+                    uploader=uploader,
+                    compressor=app[COMPRESSOR],
+                    src_path=Path(job.args["path"]),
+                )
+            case "link":
+                schedule_upload_from_url(
+                    task_manager=task_manager,
+                    uploader=uploader,
+                    url=job.args["url"],
+                    name=job.args["name"],
+                )
+            case _:
+                _L.warning(f"cannot resume job {job.key}")
+                store.remove(job.key)
+
+
 @asynccontextmanager
 async def _server_context(app: Application, host: str, port: int):
     runner = AppRunner(app)
@@ -2,29 +2,35 @@ from contextlib import contextmanager
 from functools import partial
 from logging import getLogger
 from pathlib import Path
-from tempfile import TemporaryDirectory
 
-from .lib import compress_to_path
+from .lib import Compressor
 
 
 _L = getLogger(__name__)
 
 
 @contextmanager
-def compress_context():
-    with TemporaryDirectory() as tmp:
+def compress_context(compressor: Compressor):
+    with compressor.temporary_directory() as tmp:
         work_path = Path(tmp)
-        yield partial(_compress_avif, work_path=work_path)
+        yield partial(_compress_avif, work_path=work_path, compressor=compressor)
 
 
-async def _compress_avif(src_path: Path, /, *, work_path: Path) -> Path:
-    if not src_path.is_dir():
-        return src_path
-    if not src_path.name.endswith("[AVIF][DL版]"):
+def should_compress(src_path: Path) -> bool:
+    """
+    Whether the torrent item is replaced by an archive before upload.
+    """
+    return src_path.is_dir() and src_path.name.endswith("[AVIF][DL版]")
+
+
+async def _compress_avif(
+    src_path: Path, /, *, work_path: Path, compressor: Compressor
+) -> Path:
+    if not should_compress(src_path):
         return src_path
     _L.info(f"compressing {src_path}")
-    compressed_path = await compress_to_path(
-        src_path, work_path, base_name=src_path.name
+    compressed_path = await compressor.compress(
+        src_path, work_path, base_name=src_path.name, kind="torrent"
     )
     _L.info(f"compressed {compressed_path}")
     return compressed_path
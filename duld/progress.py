@@ -0,0 +1,111 @@
+import time
+from contextvars import ContextVar
+from typing import Literal
+
+
+type JobState = Literal["waiting", "running", "done", "failed"]
+type Phase = Literal["syncing", "compressing", "uploading", "verifying"]
+
+
+class JobProgress:
+    """
+    Counters of one job, written by the upload code as it goes.
+
+    Everything runs on the event loop or adds whole numbers from finished
+    work, so the fields are plain attributes without locking.
+    """
+
+    __slots__ = (
+        "name",
+        "kind",
+        "state",
+        "phase",
+        "bytes_done",
+        "bytes_total",
+        "files_done",
+        "files_total",
+        "started_at",
+        "ended_at",
+    )
+
+    def __init__(self, name: str, kind: str) -> None:
+        self.name = name
+        self.kind = kind
+        self.state: JobState = "waiting"
+        self.phase: Phase | None = None
+        self.bytes_done = 0
+        self.bytes_total = 0
+        self.files_done = 0
+        self.files_total = 0
+        self.started_at: float | None = None
+        self.ended_at: float | None = None
+
+    def start(self) -> None:
+        self.state = "running"
+        self.started_at = time.monotonic()
+
+    def finish(self) -> None:
+        """
+        Marks the job done, unless it already failed.
+        """
+        if self.state != "failed":
+            self.state = "done"
+        self._end()
+
+    def fail(self) -> None:
+        """
+        For jobs that catch their own errors, so the failure still shows.
+        """
+        self.state = "failed"
+        self._end()
+
+    def to_dict(self) -> dict[str, object]:
+        throughput = self.get_throughput()
+        eta = None
+        if throughput:
+            eta = max(0, self.bytes_total - self.bytes_done) / throughput
+        return {
+            "key": self.name,
+            "kind": self.kind,
+            "state": self.state,
+            "phase": self.phase,
+            "bytes_done": self.bytes_done,
+            "bytes_total": self.bytes_total,
+            "files_done": self.files_done,
+            "files_total": self.files_total,
+            "throughput": throughput,
+            "eta": eta,
+        }
+
+    def get_throughput(self) -> float | None:
+        """
+        Average bytes per second since the job started.
+        """
+        if self.started_at is None:
+            return None
+        ended_at = time.monotonic() if self.ended_at is None else self.ended_at
+        elapsed = ended_at - self.started_at
+        if elapsed <= 0:
+            return None
+        return self.bytes_done / elapsed
+
+    def _end(self) -> None:
+        if self.ended_at is None:
+            self.ended_at = time.monotonic()
+
+
+# Stands in outside of jobs, so callers never check for None.
+_DETACHED = JobProgress("", "")
+_CURRENT = ContextVar[JobProgress]("job_progress", default=_DETACHED)
+
+
+def current_progress() -> JobProgress:
+    """
+    Progress of the job running in this task. Tasks started by the job
+    inherit it.
+    """
+    return _CURRENT.get()
+
+
+def set_progress(progress: JobProgress) -> None:
+    _CURRENT.set(progress)
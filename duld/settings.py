@@ -1,5 +1,5 @@
 from dataclasses import dataclass
-from typing import Any
+from typing import Any, Literal
 
 import dacite
 import yaml
@@ -26,6 +26,18 @@ class TransmissionData:
     download_dir: str | None
 
 
+CompressProfile = Literal["store", "fast", "default", "auto"]
+
+
+@dataclass
+class CompressData:
+    max_jobs: int | None
+    threads: int | None
+    hah: CompressProfile | None
+    torrent: CompressProfile | None
+    work_dir: str | None
+
+
 @dataclass
 class UploadData:
     type: str
@@ -43,6 +55,12 @@ class Data:
     transmission: TransmissionData | None
     hah_path: str | None
     max_jobs: int | None
+    max_files_per_job: int | None = None
+    compress: CompressData | None = None
+    job_queue: str | None = None
+    job_weights: dict[str, int] | None = None
+    max_upload_gb: int | None = None
+    max_scratch_gb: int | None = None
 
 
 def load_from_path(path: str) -> Data:
@@ -51,4 +69,24 @@ def load_from_path(path: str) -> Data:
         data = dacite.from_dict(Data, raw_data)
         if data.max_jobs is not None and data.max_jobs < 0:
             raise ValueError(f"max_jobs must be >= 0, got {data.max_jobs}")
+        if data.max_files_per_job is not None and data.max_files_per_job < 0:
+            raise ValueError(
+                f"max_files_per_job must be >= 0, got {data.max_files_per_job}"
+            )
+        if data.compress:
+            _check_compress(data.compress)
+        for name in ("max_upload_gb", "max_scratch_gb"):
+            value = getattr(data, name)
+            if value is not None and value < 0:
+                raise ValueError(f"{name} must be >= 0, got {value}")
+        for kind, weight in (data.job_weights or {}).items():
+            if weight < 1:
+                raise ValueError(f"job_weights.{kind} must be >= 1, got {weight}")
         return data
+
+
+def _check_compress(data: CompressData) -> None:
+    if data.max_jobs is not None and data.max_jobs < 1:
+        raise ValueError(f"compress.max_jobs must be >= 1, got {data.max_jobs}")
+    if data.threads is not None and data.threads < 1:
+        raise ValueError(f"compress.threads must be >= 1, got {data.threads}")
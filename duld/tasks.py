@@ -1,45 +1,280 @@
+import asyncio
+import json
 import logging
+from collections import deque
 from collections.abc import Awaitable, Callable, Coroutine, Hashable
+from contextlib import asynccontextmanager
 from typing import Protocol
 
+from .jobs import JobArgs, JobStore
+from .progress import JobProgress, set_progress
 
+
+# Share of a job kind without a configured weight.
+DEFAULT_WEIGHT = 1
+# Ended jobs stay listed until this many newer ones end.
+KEEP_ENDED = 50
 _L = logging.getLogger(__name__)
 
 type JobKey = Hashable
 type JobFactory = Callable[[], Awaitable[object]]
+type _Waiter = tuple[JobKey, asyncio.Future[None]]
 
 
 class TaskScheduler(Protocol):
     def create_task[T](self, coro: Coroutine[None, None, T]) -> object: ...
 
 
+class FairScheduler:
+    """
+    Lets at most `max_jobs` jobs run at once, 0 for no limit.
+
+    Waiting jobs with a priority go first, highest first. The others take
+    turns by kind (the first item of their key) in proportion to the kind
+    weights, so a flood of one kind cannot starve the others.
+    """
+
+    def __init__(self, max_jobs: int = 0, *, weights: dict[str, int] | None = None):
+        self._max_jobs = max_jobs
+        self._weights = weights or {}
+        self._running = 0
+        self._queues: dict[str, deque[_Waiter]] = {}
+        # Stride scheduling: the kind with the lowest pass goes next, and each
+        # turn moves its pass by 1 / weight.
+        self._passes: dict[str, float] = {}
+        self._vtime = 0.0
+        self._priorities: dict[JobKey, int] = {}
+
+    @asynccontextmanager
+    async def slot(self, key: JobKey):
+        await self._acquire(key)
+        try:
+            yield
+        finally:
+            self._release()
+
+    def set_priority(self, key: JobKey, priority: int) -> None:
+        if priority:
+            self._priorities[key] = priority
+        else:
+            self._priorities.pop(key, None)
+
+    async def _acquire(self, key: JobKey) -> None:
+        if not self._max_jobs:
+            self._running += 1
+            return
+        if self._running < self._max_jobs and not any(self._queues.values()):
+            self._running += 1
+            return
+
+        kind = get_kind(key)
+        queue = self._queues.setdefault(kind, deque())
+        if not queue:
+            # Coming back from idle does not earn a burst of turns.
+            self._passes[kind] = max(self._passes.get(kind, 0.0), self._vtime)
+        waiter: _Waiter = (key, asyncio.get_running_loop().create_future())
+        queue.append(waiter)
+        try:
+            await waiter[1]
+        except asyncio.CancelledError:
+            if waiter[1].cancelled():
+                # A release may have skipped it out of the queue already.
+                if waiter in queue:
+                    queue.remove(waiter)
+            else:
+                # Admitted at the same time, hand the slot on.
+                self._release()
+            raise
+
+    def _release(self) -> None:
+        self._running -= 1
+        if not self._max_jobs:
+            return
+        while self._running < self._max_jobs:
+            waiter = self._pick()
+            if not waiter:
+                return
+            if waiter[1].done():
+                # Cancelled, but its task has not run yet to leave the queue.
+                continue
+            self._running += 1
+            waiter[1].set_result(None)
+
+    def _pick(self) -> _Waiter | None:
+        chosen: tuple[str, _Waiter] | None = None
+        top = 0
+        for kind, queue in self._queues.items():
+            for waiter in queue:
+                priority = self._priorities.get(waiter[0], 0)
+                if priority > top:
+                    chosen, top = (kind, waiter), priority
+        if chosen:
+            kind, waiter = chosen
+            self._queues[kind].remove(waiter)
+            self._priorities.pop(waiter[0], None)
+        else:
+            kinds = [_ for _, queue in self._queues.items() if queue]
+            if not kinds:
+                return None
+            kind = min(kinds, key=lambda _: self._passes[_])
+            waiter = self._queues[kind].popleft()
+        self._vtime = self._passes[kind]
+        self._passes[kind] += 1 / self._weights.get(kind, DEFAULT_WEIGHT)
+        return waiter
+
+
 class UploadTaskManager:
-    def __init__(self, scheduler: TaskScheduler) -> None:
+    def __init__(
+        self,
+        scheduler: TaskScheduler,
+        *,
+        store: JobStore | None = None,
+        max_jobs: int = 0,
+        weights: dict[str, int] | None = None,
+    ) -> None:
         self._scheduler = scheduler
-        self._active = set[JobKey]()
+        self._store = store
+        self._fair = FairScheduler(max_jobs, weights=weights)
+        self._active: dict[JobKey, JobProgress] = {}
+        self._names: dict[str, JobKey] = {}
+        # Done and failed jobs by name, oldest first.
+        self._ended: dict[str, JobProgress] = {}
+        self._tasks = set[asyncio.Task[object]]()
+        self._closed = False
 
-    def create[T](self, coro: Coroutine[None, None, T]) -> object:
-        return self._scheduler.create_task(coro)
-
-    def create_once(self, key: JobKey, job_factory: JobFactory) -> bool:
+    def create_once(
+        self, key: JobKey, job_factory: JobFactory, *, args: JobArgs | None = None
+    ) -> bool:
+        """
+        Runs the job unless one with the same key is still running. Jobs with
+        args are kept in the store until they end, to be replayed after a
+        restart; the first item of key is their kind.
+        """
         if key in self._active:
             return False
 
-        self._active.add(key)
-        coro = self._run_once(key, job_factory)
+        progress = JobProgress(format_key(key), get_kind(key))
+        # The new run replaces the last one.
+        self._ended.pop(progress.name, None)
+        self._active[key] = progress
+        self._names[progress.name] = key
+        store_key = self._save(key, args)
+        coro = self._run_once(key, job_factory, store_key)
         try:
             self._scheduler.create_task(coro)
         except Exception:
             coro.close()
-            self._active.discard(key)
+            self._forget(key)
+            if self._store and store_key:
+                self._store.remove(store_key)
             raise
         return True
 
-    async def _run_once(self, key: JobKey, job_factory: JobFactory) -> None:
+    async def close(self) -> None:
+        """
+        Stops every job, saved ones run again after a restart. Must finish
+        before the uploader and clients the jobs use are closed.
+        """
+        self._closed = True
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.wait(tasks)
+
+    def set_priority(self, name: str, priority: int) -> bool:
+        """
+        Moves a waiting job ahead of others, 0 to go back to fair sharing.
+        Returns False if no such job is scheduled.
+        """
+        key = self._names.get(name)
+        if key is None:
+            return False
+        self._fair.set_priority(key, priority)
+        return True
+
+    def list_progress(self) -> list[JobProgress]:
+        """
+        Scheduled jobs, then the last KEEP_ENDED ended ones.
+        """
+        return [*self._active.values(), *self._ended.values()]
+
+    def get_progress(self, name: str) -> JobProgress | None:
+        key = self._names.get(name)
+        if key is None:
+            return self._ended.get(name)
+        return self._active.get(key)
+
+    def _forget(self, key: JobKey) -> None:
+        progress = self._active.pop(key, None)
+        if progress:
+            self._names.pop(progress.name, None)
+
+    def _keep(self, progress: JobProgress) -> None:
+        self._ended[progress.name] = progress
+        while len(self._ended) > KEEP_ENDED:
+            del self._ended[next(iter(self._ended))]
+
+    def _save(self, key: JobKey, args: JobArgs | None) -> str | None:
+        if not self._store or args is None:
+            return None
+        store_key = json.dumps(key, default=str)
+        self._store.put(store_key, get_kind(key), args)
+        return store_key
+
+    async def _run_once(
+        self, key: JobKey, job_factory: JobFactory, store_key: str | None
+    ) -> None:
+        started = False
+        progress = self._active[key]
+        # Upload code finds it through the task context.
+        set_progress(progress)
+        task = asyncio.current_task()
+        if task:
+            self._tasks.add(task)
         try:
-            await job_factory()
+            if self._closed:
+                # Scheduled but not started before close.
+                raise asyncio.CancelledError
+            async with self._fair.slot(key):
+                if self._store and store_key:
+                    self._store.start(store_key)
+                started = True
+                progress.start()
+                await job_factory()
+        except asyncio.CancelledError:
+            # Stopped by shutdown, run it again next time.
+            if self._store and store_key:
+                if started:
+                    self._store.requeue(store_key)
+                store_key = None
+            raise
         except Exception:
+            progress.fail()
             _L.exception(f"upload task failed: {key!r}")
             raise
+        else:
+            progress.finish()
         finally:
-            self._active.discard(key)
+            if task:
+                self._tasks.discard(task)
+            self._forget(key)
+            # Not after a shutdown, the job is not over.
+            if progress.ended_at is not None:
+                self._keep(progress)
+            self._fair.set_priority(key, 0)
+            if self._store and store_key:
+                self._store.remove(store_key)
+
+
+def get_kind(key: JobKey) -> str:
+    return str(key[0]) if isinstance(key, tuple) and key else ""
+
+
+def format_key(key: JobKey) -> str:
+    """
+    Name of a job for the API, e.g. "torrent:42".
+    """
+    if isinstance(key, tuple):
+        return ":".join(str(_) for _ in key)
+    return str(key)
@@ -1,22 +1,28 @@
 import asyncio
 import logging
-import os.path
 
-from transmission_rpc import Client, Torrent, TransmissionError
+from transmission_rpc import Torrent, TransmissionError
 
+from .progress import current_progress
 from .settings import DiskSpaceData, TransmissionData
 from .tasks import UploadTaskManager
+from .transmission import TransmissionClient
 from .upload import Uploader
 
 
 _L = logging.getLogger(__name__)
 
+# Only ask Transmission for what we read, the full set is huge per torrent.
+_COMPLETED_FIELDS = ["id", "leftUntilDone"]
+_PENDING_FIELDS = ["id", "status", "downloadedEver"]
+
 
 def schedule_upload_by_id(
     *,
     task_manager: UploadTaskManager,
     uploader: Uploader,
     transmission: TransmissionData,
+    torrent_client: TransmissionClient,
     torrent_id: int,
 ) -> bool:
     accepted = task_manager.create_once(
@@ -24,8 +30,10 @@ def schedule_upload_by_id(
         lambda: upload_by_id(
             uploader=uploader,
             transmission=transmission,
+            torrent_client=torrent_client,
             torrent_id=torrent_id,
         ),
+        args={"torrent_id": torrent_id},
     )
     if not accepted:
         _L.warning(f"{torrent_id} is still uploading")
@@ -36,45 +44,46 @@ async def upload_by_id(
     *,
     uploader: Uploader,
     transmission: TransmissionData,
+    torrent_client: TransmissionClient,
     torrent_id: int,
 ) -> None:
     try:
-        torrent_client = _connect_transmission(transmission)
+        torrent = await torrent_client.get_torrent(torrent_id)
     except Exception as e:
         _L.error(f"transmission error: {e}")
+        current_progress().fail()
         return
-
-    torrent = torrent_client.get_torrent(torrent_id)
     if not torrent:
         _L.warning(f"no such torrent id {torrent_id}")
         return
 
-    root_items = _get_root_items(torrent)
-    if not root_items:
+    file_list = _get_file_list(torrent)
+    if not file_list:
         _L.warning(f"{torrent.name}: no item to upload?")
         return
-    _L.debug(f"{torrent.name}: {root_items}")
+    _L.debug(f"{torrent.name}: {len(file_list)} files")
 
     torrent_root = _get_root_dir(torrent, transmission.download_dir)
     if not torrent_root:
         _L.error(f"{torrent.name}: invalid location")
+        current_progress().fail()
         return
 
     # upload files to Cloud Drive
     try:
-        await uploader.upload_from_torrent(torrent_id, torrent_root, root_items)
+        await uploader.upload_from_torrent(torrent_id, torrent_root, file_list)
     except Exception:
         _L.exception("upload failed")
         _L.error(f"retry url: /api/v1/torrents/{torrent_id}")
+        current_progress().fail()
         return
 
     # remove the task from Transmission first
-    _remove_torrent(torrent_client, torrent)
+    await _remove_torrent(torrent_client, torrent)
 
 
-def get_completed(transmission: TransmissionData) -> list[Torrent]:
-    torrent_client = _connect_transmission(transmission)
-    torrents = torrent_client.get_torrents()
+async def get_completed(torrent_client: TransmissionClient) -> list[Torrent]:
+    torrents = await torrent_client.get_torrents(arguments=_COMPLETED_FIELDS)
     completed = filter(lambda t: t.left_until_done == 0, torrents)
     return list(completed)
 
@@ -82,14 +91,12 @@ def get_completed(transmission: TransmissionData) -> list[Torrent]:
 async def add_urls(
     urls: list[str],
     *,
-    transmission: TransmissionData,
+    torrent_client: TransmissionClient,
 ) -> dict[str, Torrent | None]:
-    torrent_client = _connect_transmission(transmission)
-
     torrent_dict: dict[str, Torrent | None] = {}
     for url in urls:
         try:
-            torrent = torrent_client.add_torrent(url, paused=True)
+            torrent = await torrent_client.add_torrent(url, paused=True)
             torrent_dict[url] = torrent
         except Exception as e:
             _L.error(f"failed to add torrent {url}: {e}")
@@ -98,18 +105,8 @@ async def add_urls(
     return torrent_dict
 
 
-def _get_root_items(torrent: Torrent) -> list[str]:
-    files = torrent.get_files()
-    common: set[str] = set()
-
-    # find common path
-    for item in files:
-        if not item.selected:
-            continue
-        parts = _split_all(item.name)
-        common.add(parts[0])
-
-    return list(common)
+def _get_file_list(torrent: Torrent) -> list[str]:
+    return [_.name for _ in torrent.get_files() if _.selected]
 
 
 def _get_root_dir(torrent: Torrent, download_dir: str | None) -> str | None:
@@ -118,65 +115,36 @@ def _get_root_dir(torrent: Torrent, download_dir: str | None) -> str | None:
     return torrent.download_dir
 
 
-def _remove_torrent(client: Client, torrent: Torrent) -> None:
-    client.remove_torrent(torrent.id, delete_data=True)
+async def _remove_torrent(client: TransmissionClient, torrent: Torrent) -> None:
+    await client.remove_torrent(torrent.id, delete_data=True)
     _L.info(f"{torrent.name}: remove torrent")
 
 
-def _split_all(path: str) -> list[str]:
-    """
-    Returns path parts by directories.
-    """
-    allparts: list[str] = []
-    while True:
-        parts = os.path.split(path)
-        if parts[0] == path:  # sentinel for absolute paths
-            allparts.insert(0, parts[0])
-            break
-        elif parts[1] == path:  # sentinel for relative paths
-            allparts.insert(0, parts[1])
-            break
-        else:
-            path = parts[0]
-            allparts.insert(0, parts[1])
-    return allparts
-
-
-def _connect_transmission(transmission: TransmissionData) -> Client:
-    opt = transmission
-    client = Client(
-        host=opt.host,
-        port=opt.port,
-        username=opt.username,
-        password=opt.password,
-    )
-    return client
-
-
 async def watch_disk_space(
-    *, transmission: TransmissionData, disk_space: DiskSpaceData
+    *, torrent_client: TransmissionClient, disk_space: DiskSpaceData
 ):
     halted_ids: list[int] = []
     while True:
         await asyncio.sleep(60)
         try:
-            halted_ids = _check_disk_space(transmission, disk_space, halted_ids)
+            halted_ids = await _check_disk_space(torrent_client, disk_space, halted_ids)
         except TransmissionError as e:
-            _L.error(f"transmission error {e}. data: {transmission}")
+            _L.error(f"transmission error {e}")
         except Exception:
             _L.exception("cannot check disk space")
 
 
-def _check_disk_space(
-    transmission: TransmissionData, disk_space: DiskSpaceData, halted_ids: list[int]
+async def _check_disk_space(
+    torrent_client: TransmissionClient,
+    disk_space: DiskSpaceData,
+    halted_ids: list[int],
 ) -> list[int]:
     if disk_space.safe <= disk_space.danger:
         raise ValueError("invalid disk space range")
 
-    torrent_client = _connect_transmission(transmission)
-    torrent_session = torrent_client.get_session()
+    torrent_session = await torrent_client.get_session()
     download_dir = torrent_session.download_dir
-    free_space = torrent_client.free_space(download_dir)
+    free_space = await torrent_client.free_space(download_dir)
     if free_space is None:
         _L.warning("cannot get free space")
         return halted_ids
@@ -185,28 +153,30 @@ def _check_disk_space(
     if free_space_in_gb >= disk_space.safe:
         if halted_ids:
             _L.info(f"resuming halted torrents: {free_space_in_gb}")
-            _resume_halted_torrents(torrent_client, halted_ids)
+            await _resume_halted_torrents(torrent_client, halted_ids)
         return []
 
     if free_space_in_gb <= disk_space.danger:
         if not halted_ids:
             _L.info(f"halting queued torrents: {free_space_in_gb}")
-            halted_ids = _halt_pending_torrents(torrent_client)
+            halted_ids = await _halt_pending_torrents(torrent_client)
         return halted_ids
 
     return halted_ids
 
 
-def _halt_pending_torrents(client: Client) -> list[int]:
-    torrents = client.get_torrents()
+async def _halt_pending_torrents(client: TransmissionClient) -> list[int]:
+    torrents = await client.get_torrents(arguments=_PENDING_FIELDS)
     torrent_id_list = [
         t.id for t in torrents if t.status == "downloading" and t.downloaded_ever == 0
     ]
     if torrent_id_list:
-        client.stop_torrent(torrent_id_list)  # type: ignore
+        await client.stop_torrent(torrent_id_list)
     return torrent_id_list
 
 
-def _resume_halted_torrents(client: Client, torrent_id_list: list[int]) -> None:
+async def _resume_halted_torrents(
+    client: TransmissionClient, torrent_id_list: list[int]
+) -> None:
     if torrent_id_list:
-        client.start_torrent(torrent_id_list)  # type: ignore
+        await client.start_torrent(torrent_id_list)
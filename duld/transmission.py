@@ -0,0 +1,116 @@
+import asyncio
+import logging
+from collections.abc import Callable
+from concurrent.futures import Executor, ThreadPoolExecutor
+from contextlib import asynccontextmanager
+
+from transmission_rpc import (
+    Client,
+    Session,
+    Torrent,
+    TransmissionConnectError,
+    TransmissionTimeoutError,
+)
+
+from .settings import TransmissionData
+
+
+_L = logging.getLogger(__name__)
+
+
+class TransmissionClient:
+    """
+    Async facade of a long-lived transmission_rpc.Client.
+
+    transmission-rpc only does blocking HTTP, so every call runs in the given
+    executor to keep the event loop responsive when the daemon is slow. The
+    underlying client (and its session id) is created on first use, reused by
+    later calls, and recreated after a connection failure.
+    """
+
+    def __init__(self, transmission: TransmissionData, *, pool: Executor) -> None:
+        self._transmission = transmission
+        self._pool = pool
+        self._client: Client | None = None
+
+    async def get_torrent(self, torrent_id: int) -> Torrent | None:
+        try:
+            return await self._call(lambda _: _.get_torrent(torrent_id))
+        except KeyError:
+            return None
+
+    async def get_torrents(
+        self, *, arguments: list[str] | None = None
+    ) -> list[Torrent]:
+        return await self._call(lambda _: _.get_torrents(arguments=arguments))
+
+    async def add_torrent(self, url: str, *, paused: bool) -> Torrent:
+        return await self._call(lambda _: _.add_torrent(url, paused=paused))
+
+    async def remove_torrent(self, torrent_id: int, *, delete_data: bool) -> None:
+        await self._call(
+            lambda _: _.remove_torrent(torrent_id, delete_data=delete_data)
+        )
+
+    async def start_torrent(self, torrent_id_list: list[int]) -> None:
+        await self._call(lambda _: _.start_torrent(torrent_id_list))  # type: ignore
+
+    async def stop_torrent(self, torrent_id_list: list[int]) -> None:
+        await self._call(lambda _: _.stop_torrent(torrent_id_list))  # type: ignore
+
+    async def get_session(self) -> Session:
+        return await self._call(lambda _: _.get_session())
+
+    async def free_space(self, path: str) -> int | None:
+        return await self._call(lambda _: _.free_space(path))
+
+    async def close(self) -> None:
+        # Not through _call, it would connect first if nothing ever did.
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._pool, self._disconnect)
+
+    async def _call[R](self, fn: Callable[[Client], R]) -> R:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._pool, self._call_in_worker, fn)
+
+    def _call_in_worker[R](self, fn: Callable[[Client], R]) -> R:
+        if not self._client:
+            # The constructor already talks to the daemon.
+            self._client = _create_client(self._transmission)
+        try:
+            return fn(self._client)
+        except (TransmissionConnectError, TransmissionTimeoutError):
+            _L.warning("transmission connection lost, will reconnect")
+            self._disconnect()
+            raise
+
+    def _disconnect(self) -> None:
+        if self._client:
+            self._client.__exit__(None, None, None)
+            self._client = None
+
+
+@asynccontextmanager
+async def create_transmission_client(transmission: TransmissionData):
+    # One worker thread serializes calls over the single shared connection.
+    pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="transmission")
+    client = TransmissionClient(transmission, pool=pool)
+    try:
+        yield client
+    finally:
+        try:
+            await asyncio.wait_for(client.close(), timeout=1)
+        except Exception:
+            _L.warning("cannot close transmission client")
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _create_client(transmission: TransmissionData) -> Client:
+    opt = transmission
+    client = Client(
+        host=opt.host,
+        port=opt.port,
+        username=opt.username,
+        password=opt.password,
+    )
+    return client
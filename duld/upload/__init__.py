@@ -1,6 +1,8 @@
 from contextlib import asynccontextmanager
 
 from ..dfd import create_dfd_client
+from ..filters import FilterStore
+from ..lib import Compressor
 from ..settings import Data
 from ._core import Uploader, UploadError
 from ._core import create_uploader as _make_uploader
@@ -10,8 +12,10 @@ __all__ = ["create_uploader", "Uploader", "UploadError"]
 
 
 @asynccontextmanager
-async def create_uploader(cfg: Data):
-    async with create_dfd_client(cfg.exclude) as dfd_client:
+async def create_uploader(
+    cfg: Data, *, compressor: Compressor, filter_store: FilterStore | None = None
+):
+    async with create_dfd_client(cfg.exclude, store=filter_store) as dfd_client:
         match cfg.upload.type:
             case "drive":
                 from ._drive import create_drive_backend
@@ -20,7 +24,10 @@ async def create_uploader(cfg: Data):
                     yield _make_uploader(
                         backend=backend,
                         dfd_client=dfd_client,
-                        max_jobs=cfg.max_jobs or 0,
+                        max_files=_get_max_files(cfg),
+                        max_bytes=_gb_to_bytes(cfg.max_upload_gb),
+                        max_scratch_bytes=_gb_to_bytes(cfg.max_scratch_gb),
+                        compressor=compressor,
                     )
             case "local":
                 from ._local import create_local_backend
@@ -29,7 +36,20 @@ async def create_uploader(cfg: Data):
                 yield _make_uploader(
                     backend=backend,
                     dfd_client=dfd_client,
-                    max_jobs=cfg.max_jobs or 0,
+                    max_files=_get_max_files(cfg),
+                    max_bytes=_gb_to_bytes(cfg.max_upload_gb),
+                    max_scratch_bytes=_gb_to_bytes(cfg.max_scratch_gb),
+                    compressor=compressor,
                 )
             case _:
                 raise ValueError(f"unknown upload type: {cfg.upload.type}")
+
+
+def _get_max_files(cfg: Data) -> int:
+    if cfg.max_files_per_job is None:
+        return 1
+    return cfg.max_files_per_job
+
+
+def _gb_to_bytes(gb: int | None) -> int:
+    return (gb or 0) * 1024 * 1024 * 1024
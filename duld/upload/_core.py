@@ -1,18 +1,29 @@
 import asyncio
 import logging
 from abc import ABCMeta, abstractmethod
-from asyncio import as_completed
-from contextlib import contextmanager, nullcontext
+from asyncio import TaskGroup
+from collections import deque
+from collections.abc import Awaitable, Callable, Hashable, Iterable
+from contextlib import asynccontextmanager, contextmanager, nullcontext
 from pathlib import Path, PurePath
 from typing import Protocol
 
-from ..dfd import DfdClient, FilterList, should_exclude
-from ..processors import compress_context
+from ..dfd import DfdClient, FilterList, PathTree, prune_paths, should_exclude
+from ..lib import Compressor
+from ..processors import compress_context, should_compress
+from ..progress import current_progress
 
 
 RETRY_TIMES = 3
+# Root items being compressed at once, and compressed items waiting for upload.
+COMPRESS_WORKERS = 2
+UPLOAD_QUEUE_SIZE = 2
 _L = logging.getLogger(__name__)
 
+type _JobContext = asyncio.Semaphore | nullcontext[None]
+# Path to upload, its known tree, and scratch bytes reserved for it.
+type _Prepared = tuple[Path, PathTree | None, int]
+
 
 class UploadError(Exception):
     pass
@@ -23,6 +34,9 @@ class HashError(UploadError):
 
 
 class StorageBackend[E](metaclass=ABCMeta):
+    @abstractmethod
+    def get_id(self, entry: E) -> Hashable: ...
+
     @abstractmethod
     async def get_root_folder(self) -> E: ...
 
@@ -44,7 +58,11 @@ class StorageBackend[E](metaclass=ABCMeta):
     async def resolve_path(self, entry: E) -> PurePath: ...
 
     @abstractmethod
-    async def sync(self) -> None: ...
+    async def sync(self, *, force: bool = False) -> None:
+        """
+        Pulls remote changes. `force` skips any freshness window, for callers
+        that must see their own last change.
+        """
 
     @abstractmethod
     async def ensure_entry_exists(self, entry: E) -> None: ...
@@ -60,19 +78,133 @@ class Uploader(Protocol):
     async def upload_from_hah(self, local_path: Path, *, remote_name: str) -> None: ...
 
     async def upload_from_torrent(
-        self, torrent_id: int, torrent_root: str, root_items: list[str]
+        self, torrent_id: int, torrent_root: str, file_list: list[str]
     ) -> None: ...
 
     async def upload_from_path(self, local_path: Path) -> None: ...
 
 
+class _EntryCache[E]:
+    """
+    Remembers child lookups and resolved paths until the next sync, so files
+    in the same folder do not look up their parent again and again.
+    """
+
+    def __init__(self, backend: StorageBackend[E]) -> None:
+        self._backend = backend
+        self._children: dict[tuple[Hashable, str], E | None] = {}
+        self._paths: dict[Hashable, PurePath] = {}
+
+    def clear(self) -> None:
+        self._children.clear()
+        self._paths.clear()
+
+    async def get_child(self, name: str, parent: E) -> E | None:
+        key = (self._backend.get_id(parent), name)
+        if key in self._children:
+            return self._children[key]
+        child = await self._backend.get_child(name, parent)
+        self._children[key] = child
+        return child
+
+    async def create_folder(self, name: str, parent: E) -> E:
+        child = await self._backend.create_folder(name, parent)
+        self._children[(self._backend.get_id(parent), name)] = child
+        return child
+
+    async def upload_file(self, local_path: Path, parent: E, *, name: str) -> E:
+        # Drop the old answer first, it is wrong even if the upload fails.
+        key = (self._backend.get_id(parent), name)
+        self._children.pop(key, None)
+        child = await self._backend.upload_file(local_path, parent, name=name)
+        self._children[key] = child
+        return child
+
+    async def resolve_path(self, entry: E) -> PurePath:
+        key = self._backend.get_id(entry)
+        path = self._paths.get(key)
+        if path is None:
+            path = await self._backend.resolve_path(entry)
+            self._paths[key] = path
+        return path
+
+
 def create_uploader[E](
-    *, backend: StorageBackend[E], dfd_client: DfdClient, max_jobs: int = 0
+    *,
+    backend: StorageBackend[E],
+    dfd_client: DfdClient,
+    compressor: Compressor,
+    max_files: int = 1,
+    max_bytes: int = 0,
+    max_scratch_bytes: int = 0,
 ) -> "_DefaultUploader[E]":
-    return _DefaultUploader(backend=backend, dfd_client=dfd_client, max_jobs=max_jobs)
-
+    return _DefaultUploader(
+        backend=backend,
+        dfd_client=dfd_client,
+        compressor=compressor,
+        max_files=max_files,
+        max_bytes=max_bytes,
+        max_scratch_bytes=max_scratch_bytes,
+    )
+
+
+class ByteBudget:
+    """
+    Admits work while the reserved bytes stay within `limit`, 0 for no limit.
+    Waiters are served in order, and work larger than the limit runs alone
+    once nothing else is reserved, so nothing waits forever.
+    """
+
+    def __init__(self, limit: int = 0) -> None:
+        self._limit = limit
+        self._used = 0
+        self._waiters: deque[tuple[int, asyncio.Future[None]]] = deque()
+
+    @property
+    def used(self) -> int:
+        return self._used
+
+    @asynccontextmanager
+    async def reserve(self, size: int):
+        await self.acquire(size)
+        try:
+            yield
+        finally:
+            self.release(size)
+
+    async def acquire(self, size: int) -> None:
+        if not self._limit or (not self._waiters and self._fits(size)):
+            self._used += size
+            return
 
-def _make_job_context(max_jobs: int):
+        waiter = (size, asyncio.get_running_loop().create_future())
+        self._waiters.append(waiter)
+        try:
+            await waiter[1]
+        except asyncio.CancelledError:
+            if waiter[1].cancelled():
+                self._waiters.remove(waiter)
+                # It may have been blocking smaller ones behind it.
+                self._wake()
+            else:
+                self.release(size)
+            raise
+
+    def release(self, size: int) -> None:
+        self._used -= size
+        self._wake()
+
+    def _fits(self, size: int) -> bool:
+        return not self._used or self._used + size <= self._limit
+
+    def _wake(self) -> None:
+        while self._waiters and self._fits(self._waiters[0][0]):
+            size, future = self._waiters.popleft()
+            self._used += size
+            future.set_result(None)
+
+
+def _make_job_context(max_jobs: int) -> _JobContext:
     if max_jobs:
         return asyncio.Semaphore(max_jobs)
     return nullcontext()
@@ -84,15 +216,27 @@ class _DefaultUploader[E]:
         *,
         backend: StorageBackend[E],
         dfd_client: DfdClient,
-        max_jobs: int = 0,
+        compressor: Compressor,
+        max_files: int = 1,
+        max_bytes: int = 0,
+        max_scratch_bytes: int = 0,
     ) -> None:
         self._backend = backend
+        self._entries = _EntryCache(backend)
         self._dfd = dfd_client
-        self._job_lock = _make_job_context(max_jobs)
+        self._compressor = compressor
+        self._max_files = max_files
+        # Bytes of the jobs being uploaded, and of archives not uploaded yet.
+        self._budget = ByteBudget(max_bytes)
+        self._scratch = ByteBudget(max_scratch_bytes)
 
     async def upload_from_hah(self, local_path: Path, *, remote_name: str) -> None:
-        async with self._job_lock:
-            await self._backend.sync()
+        size = await asyncio.to_thread(_get_size, local_path)
+        progress = current_progress()
+        progress.bytes_total += size
+        progress.files_total += 1
+        async with self._budget.reserve(size):
+            await self._sync()
             entry = await self._backend.get_root_folder()
             await self._upload_file_retry(entry, local_path, remote_name=remote_name)
 
@@ -100,33 +244,95 @@ class _DefaultUploader[E]:
         self,
         torrent_id: int,
         torrent_root: str,
-        root_items: list[str],
+        file_list: list[str],
     ) -> None:
         filters = await self._dfd.fetch_filters()
+        # Excluded subtrees never reach the disk walk below.
+        tree = prune_paths(file_list, filters)
+        size = await asyncio.to_thread(_get_tree_size, Path(torrent_root), tree)
+        current_progress().bytes_total += size
 
-        async with self._job_lock:
-            await self._backend.sync()
-
+        async with self._budget.reserve(size):
+            await self._sync()
             entry = await self._backend.get_root_folder()
-
-            src_list = (Path(torrent_root, _) for _ in root_items)
-
-            with compress_context() as compress_avif:
-                pending_list = as_completed((compress_avif(_) for _ in src_list))
-
-                async_list = (await _ for _ in pending_list)
-
-                async for item in async_list:
-                    await self._upload(entry, item, filters=filters)
+            await self._upload_torrent_items(entry, Path(torrent_root), tree, filters)
 
     async def upload_from_path(self, local_path: Path) -> None:
-        async with self._job_lock:
-            await self._backend.sync()
+        size = await asyncio.to_thread(_get_size, local_path)
+        current_progress().bytes_total += size
+        async with self._budget.reserve(size):
+            await self._sync()
             entry = await self._backend.get_root_folder()
             await self._upload(entry, local_path, filters=[])
 
-    async def _upload(self, entry: E, local_path: Path, *, filters: FilterList) -> None:
-        if should_exclude(local_path.name, filters):
+    async def _upload_torrent_items(
+        self, entry: E, torrent_root: Path, tree: PathTree, filters: FilterList
+    ) -> None:
+        # Scratch bytes of archives made but not uploaded yet.
+        held = 0
+
+        async def upload(item: _Prepared) -> None:
+            nonlocal held
+            local_path, children, scratch = item
+            try:
+                await self._upload(entry, local_path, filters=filters, tree=children)
+            finally:
+                if scratch:
+                    # Free the disk now instead of at the end of the job.
+                    local_path.unlink(missing_ok=True)
+                    held -= scratch
+                    self._scratch.release(scratch)
+
+        # Compress the next items while uploading the finished ones.
+        with compress_context(self._compressor) as compress_avif:
+
+            async def prepare(name: str) -> _Prepared:
+                nonlocal held
+                src_path = torrent_root / name
+                if not should_compress(src_path):
+                    return src_path, tree[name], 0
+                # The archive is at most about as large as its source.
+                scratch = await asyncio.to_thread(_get_size, src_path)
+                await self._scratch.acquire(scratch)
+                held += scratch
+                progress = current_progress()
+                progress.phase = "compressing"
+                dst_path = await compress_avif(src_path)
+                # Count the archive instead of the files it replaces.
+                archive_size = await asyncio.to_thread(_get_size, dst_path)
+                item_size = await asyncio.to_thread(
+                    _get_tree_size, torrent_root, {name: tree[name]}
+                )
+                progress.bytes_total += archive_size - item_size
+                # A compressed archive has to be looked at on disk.
+                return dst_path, None, scratch
+
+            try:
+                await _run_pipeline(
+                    tree,
+                    prepare,
+                    upload,
+                    workers=COMPRESS_WORKERS,
+                    depth=UPLOAD_QUEUE_SIZE,
+                )
+            finally:
+                self._scratch.release(held)
+
+    async def _sync(self, *, force: bool = False) -> None:
+        current_progress().phase = "syncing"
+        await self._backend.sync(force=force)
+        self._entries.clear()
+
+    async def _upload(
+        self,
+        entry: E,
+        local_path: Path,
+        *,
+        filters: FilterList,
+        tree: PathTree | None = None,
+    ) -> None:
+        # A known tree is already filtered.
+        if tree is None and should_exclude(local_path.name, filters):
             _L.info(f"excluded {local_path}")
             return
 
@@ -134,16 +340,90 @@ class _DefaultUploader[E]:
             _L.warning(f"cannot upload non-exist path {local_path}")
             return
 
+        if tree is not None:
+            await self._upload_files(entry, local_path, filters=filters, tree=tree)
+            return
+
         if not local_path.is_dir():
+            current_progress().files_total += 1
             await self._upload_file_retry(
                 entry, local_path, remote_name=local_path.name
             )
             return
 
-        child_entry = await self._upload_directory(entry, local_path)
+        await self._upload_files(entry, local_path, filters=filters)
 
-        for child_path in local_path.iterdir():
-            await self._upload(child_entry, child_path, filters=filters)
+    async def _upload_files(
+        self,
+        entry: E,
+        local_path: Path,
+        *,
+        filters: FilterList,
+        tree: PathTree | None = None,
+    ) -> None:
+        file_list = await self._upload_tree(
+            entry, local_path, filters=filters, tree=tree
+        )
+        current_progress().files_total += len(file_list)
+
+        # Folders are all in place, files can go in any order.
+        file_lock = _make_job_context(self._max_files)
+        async with TaskGroup() as group:
+            for parent, file_path in file_list:
+                group.create_task(
+                    self._upload_file_limited(file_lock, parent, file_path)
+                )
+
+    async def _upload_tree(
+        self,
+        entry: E,
+        local_path: Path,
+        *,
+        filters: FilterList,
+        tree: PathTree | None = None,
+    ) -> list[tuple[E, Path]]:
+        """
+        Creates remote folders in breadth-first order, so parents always exist
+        before their children. Returns files to upload with their parents.
+        Folders with a known tree are not listed from disk.
+        """
+        file_list: list[tuple[E, Path]] = []
+        pending = deque([(entry, local_path, tree)])
+        while pending:
+            parent, dir_path, children = pending.popleft()
+            child_entry = await self._upload_directory(parent, dir_path)
+            if children is not None:
+                for name, sub_tree in children.items():
+                    child_path = dir_path / name
+                    # The torrent may list files that never made it to disk.
+                    if not child_path.exists():
+                        _L.warning(f"cannot upload non-exist path {child_path}")
+                        continue
+                    if sub_tree is None:
+                        file_list.append((child_entry, child_path))
+                    else:
+                        pending.append((child_entry, child_path, sub_tree))
+                continue
+            for child_path in dir_path.iterdir():
+                if should_exclude(child_path.name, filters):
+                    _L.info(f"excluded {child_path}")
+                    continue
+                if not child_path.exists():
+                    _L.warning(f"cannot upload non-exist path {child_path}")
+                    continue
+                if child_path.is_dir():
+                    pending.append((child_entry, child_path, None))
+                else:
+                    file_list.append((child_entry, child_path))
+        return file_list
+
+    async def _upload_file_limited(
+        self, lock: _JobContext, entry: E, local_path: Path
+    ) -> None:
+        async with lock:
+            await self._upload_file_retry(
+                entry, local_path, remote_name=local_path.name
+            )
 
     async def _upload_directory(self, entry: E, local_path: Path) -> E:
         if await self._backend.is_trashed(entry):
@@ -151,9 +431,9 @@ class _DefaultUploader[E]:
 
         dir_name = local_path.name
 
-        child = await self._backend.get_child(dir_name, entry)
+        child = await self._entries.get_child(dir_name, entry)
         if child is None:
-            child = await self._backend.create_folder(dir_name, entry)
+            child = await self._entries.create_folder(dir_name, entry)
 
         if await self._backend.is_trashed(child):
             raise UploadError(f"{dir_name} should not be trashed")
@@ -176,16 +456,18 @@ class _DefaultUploader[E]:
                 raise
             except Exception:
                 _L.exception("retry upload file")
-            await self._backend.sync()
+            # The failed attempt may have left a partial file behind.
+            await self._sync(force=True)
         raise UploadError(f"tried upload {RETRY_TIMES} times")
 
     async def _upload_file(
         self, entry: E, local_path: Path, *, remote_name: str
     ) -> None:
-        remote_path = await self._backend.resolve_path(entry)
+        remote_path = await self._entries.resolve_path(entry)
         remote_path = remote_path / remote_name
 
-        child = await self._backend.get_child(remote_name, entry)
+        child = await self._entries.get_child(remote_name, entry)
+        progress = current_progress()
 
         if child is not None:
             if await self._backend.is_trashed(child):
@@ -194,13 +476,82 @@ class _DefaultUploader[E]:
             if await self._backend.is_directory(child):
                 raise UploadError(f"{remote_path} already exists but it is a folder")
 
+            progress.phase = "verifying"
             await self._backend.verify_file(local_path, child, remote_path)
             _L.info(f"{remote_path} already exists and is the same file")
+            progress.bytes_done += local_path.stat().st_size
+            progress.files_done += 1
             return
 
-        child = await self._backend.upload_file(local_path, entry, name=remote_name)
+        # Backends count bytes as they send them.
+        progress.phase = "uploading"
+        child = await self._entries.upload_file(local_path, entry, name=remote_name)
+        progress.phase = "verifying"
         await self._backend.verify_file(local_path, child, remote_path)
         _L.info(f"finished {remote_path}")
+        progress.files_done += 1
+
+
+async def _run_pipeline[T, R](
+    items: Iterable[T],
+    produce: Callable[[T], Awaitable[R]],
+    consume: Callable[[R], Awaitable[None]],
+    *,
+    workers: int,
+    depth: int,
+) -> None:
+    """
+    Runs up to `workers` producers concurrently and consumes their results one
+    at a time in completion order. A producer holds its slot until the queue
+    has room, so at most `workers + depth` results are pending.
+    """
+    queue = asyncio.Queue[tuple[R] | None](maxsize=depth)
+    async with TaskGroup() as group:
+        group.create_task(_produce_all(items, produce, queue, workers=workers))
+        while (result := await queue.get()) is not None:
+            await consume(result[0])
+
+
+async def _produce_all[T, R](
+    items: Iterable[T],
+    produce: Callable[[T], Awaitable[R]],
+    queue: asyncio.Queue[tuple[R] | None],
+    *,
+    workers: int,
+) -> None:
+    lock = asyncio.Semaphore(workers)
+
+    async def produce_one(item: T) -> None:
+        async with lock:
+            result = await produce(item)
+            await queue.put((result,))
+
+    async with TaskGroup() as group:
+        for item in items:
+            group.create_task(produce_one(item))
+    await queue.put(None)
+
+
+def _get_size(path: Path) -> int:
+    """
+    Total size of a file or folder, 0 if it is gone.
+    """
+    try:
+        if not path.is_dir():
+            return path.stat().st_size
+        return sum(_.stat().st_size for _ in path.rglob("*") if _.is_file())
+    except OSError:
+        return 0
+
+
+def _get_tree_size(root: Path, tree: PathTree) -> int:
+    total = 0
+    for name, children in tree.items():
+        if children is None:
+            total += _get_size(root / name)
+        else:
+            total += _get_tree_size(root / name, children)
+    return total
 
 
 @contextmanager
@@ -1,7 +1,10 @@
 import asyncio
 import logging
-from concurrent.futures import Executor
-from contextlib import AsyncExitStack, asynccontextmanager
+import threading
+import time
+from collections.abc import Callable
+from concurrent.futures import Executor, ProcessPoolExecutor
+from contextlib import AsyncExitStack, asynccontextmanager, suppress
 from pathlib import Path, PurePath
 from typing import override
 
@@ -13,14 +16,24 @@ from wcpan.drive.cli.lib import (
     get_mime_type,
 )
 from wcpan.drive.core.exceptions import NodeNotFoundError
-from wcpan.drive.core.lib import dispatch_change, upload_file_from_local
-from wcpan.drive.core.types import Drive, Node
+from wcpan.drive.core.lib import dispatch_change
+from wcpan.drive.core.types import CreateHasher, Drive, MediaInfo, Node
 
+from ..progress import current_progress
 from ..settings import UploadData
 from ._core import HashError, StorageBackend, UploadError
 
 
 _L = logging.getLogger(__name__)
+# Give the remote a moment to settle before pulling changes.
+_SYNC_DELAY = 1
+_CHUNK_SIZE = 256 * 1024
+# Chunks read and hashed ahead of the upload.
+_READ_AHEAD = 4
+_DEFAULT_MIME_TYPE = "application/octet-stream"
+# Backoff between syncs while waiting for a new folder to show up.
+_BACKOFF_INITIAL = 1
+_BACKOFF_MAX = 30
 
 
 class DriveBackend(StorageBackend[Node]):
@@ -30,11 +43,47 @@ class DriveBackend(StorageBackend[Node]):
         pool: Executor,
         drive: Drive,
         upload_to: PurePath,
+        sync_interval: float = 0,
+        materialize_timeout: float = 600,
     ) -> None:
         self._pool = pool
         self._drive = drive
         self._upload_to = upload_to
-        self._sync_lock = asyncio.Lock()
+        self._sync_interval = sync_interval
+        self._sync_task: asyncio.Task[None] | None = None
+        self._synced_at = float("-inf")
+        # Pulls begun and finished, so callers can tell if a pull saw their
+        # changes.
+        self._pull_started = 0
+        self._pull_finished = 0
+        self._sync_count = 0
+        self._sync_seconds = 0.0
+        self._materialize_timeout = materialize_timeout
+        self._waiters: dict[str, set[asyncio.Event]] = {}
+        self._materialize_count = 0
+        self._materialize_seconds = 0.0
+        # Local hashes computed while uploading, consumed by verify_file.
+        self._uploaded_hashes: dict[str, str] = {}
+
+    @property
+    def sync_count(self) -> int:
+        return self._sync_count
+
+    @property
+    def sync_seconds(self) -> float:
+        return self._sync_seconds
+
+    @property
+    def materialize_count(self) -> int:
+        return self._materialize_count
+
+    @property
+    def materialize_seconds(self) -> float:
+        return self._materialize_seconds
+
+    @override
+    def get_id(self, entry: Node) -> str:
+        return entry.id
 
     @override
     async def get_root_folder(self) -> Node:
@@ -53,31 +102,93 @@ class DriveBackend(StorageBackend[Node]):
 
     @override
     async def upload_file(self, local_path: Path, parent: Node, *, name: str) -> Node:
-        mime_type = get_mime_type(local_path)
-        media_info = get_media_info(local_path)
-        child = await upload_file_from_local(
-            self._drive,
+        # Probing a large video can take seconds, keep it off the loop.
+        loop = asyncio.get_running_loop()
+        mime_type, media_info = await loop.run_in_executor(
+            self._pool, _get_file_info, local_path
+        )
+        child, local_hash = await self._upload_and_hash(
             local_path,
             parent,
             name=name,
             mime_type=mime_type,
             media_info=media_info,
         )
-        if not child:
-            raise UploadError(f"upload failed for {name}")
-        if not child.hash:
-            raise UploadError(f"{name} has invalid hash after upload")
+        self._uploaded_hashes[child.id] = local_hash
         return child
 
+    async def _upload_and_hash(
+        self,
+        local_path: Path,
+        parent: Node,
+        *,
+        name: str,
+        mime_type: str,
+        media_info: MediaInfo | None,
+    ) -> tuple[Node, str]:
+        """
+        Feeds every chunk to both the remote file and the hasher, so the file
+        is read only once. Reading and hashing run in a thread, a few chunks
+        ahead of the upload.
+        """
+        create_hasher = await self._drive.get_hasher_factory(parent)
+        size = local_path.stat().st_size
+        progress = current_progress()
+        loop = asyncio.get_running_loop()
+        chunks = asyncio.Queue[bytes | None](maxsize=_READ_AHEAD)
+        stop = threading.Event()
+
+        def send(chunk: bytes | None) -> bool:
+            if stop.is_set():
+                return False
+            asyncio.run_coroutine_threadsafe(chunks.put(chunk), loop).result()
+            return True
+
+        reader = asyncio.ensure_future(
+            asyncio.to_thread(_read_and_hash, local_path, create_hasher, send)
+        )
+        sent = 0
+        try:
+            async with self._drive.upload_file(
+                name=name,
+                parent=parent,
+                size=size,
+                mime_type=mime_type or _DEFAULT_MIME_TYPE,
+                media_info=media_info,
+            ) as fout:
+                while (chunk := await chunks.get()) is not None:
+                    await fout.write(chunk)
+                    sent += len(chunk)
+                    progress.bytes_done += len(chunk)
+                local_hash = await reader
+                await fout.flush()
+                child = await fout.node()
+            if not child:
+                raise UploadError(f"upload failed for {name}")
+            if not child.hash:
+                raise UploadError(f"{name} has invalid hash after upload")
+        except BaseException:
+            # The retry sends it all again.
+            progress.bytes_done -= sent
+            # Unblock the reader so it sees the stop.
+            stop.set()
+            while not chunks.empty():
+                chunks.get_nowait()
+            await asyncio.wait([reader])
+            raise
+        return child, local_hash
+
     @override
     async def verify_file(
         self, local_path: Path, entry: Node, remote_path: PurePath
     ) -> None:
         if not entry.hash:
             raise HashError(f"{remote_path} has invalid hash")
-        local_hash = await get_file_hash(
-            local_path, drive=self._drive, pool=self._pool, node=entry
-        )
+        local_hash = self._uploaded_hashes.pop(entry.id, None)
+        if local_hash is None:
+            local_hash = await get_file_hash(
+                local_path, drive=self._drive, pool=self._pool, node=entry
+            )
         if local_hash != entry.hash:
             raise HashError(
                 f"(remote) {remote_path} has a different hash ({local_hash}, {entry.hash})"
@@ -88,30 +199,97 @@ class DriveBackend(StorageBackend[Node]):
         return await self._drive.resolve_path(entry)
 
     @override
-    async def sync(self) -> None:
-        async with self._sync_lock:
-            await asyncio.sleep(1)
-            count = 0
-            async for change in self._drive.sync():
-                count += 1
-                dispatch_change(
-                    change,
-                    on_remove=lambda _: None,
-                    on_update=lambda _: None,
-                )
-            _L.info(f"sync {count}")
+    async def sync(self, *, force: bool = False) -> None:
+        if not force and time.monotonic() - self._synced_at < self._sync_interval:
+            return
+        await self._sync_once()
+
+    async def _sync_once(self) -> None:
+        # Concurrent callers share the sync in flight, unless it began pulling
+        # before this call and may miss what the caller just changed.
+        wanted = self._pull_started + 1
+        while self._pull_finished < wanted:
+            task = self._sync_task
+            if not task:
+                task = asyncio.create_task(self._pull_changes())
+                task.add_done_callback(self._on_sync_done)
+                self._sync_task = task
+            await asyncio.shield(task)
+
+    def _on_sync_done(self, task: asyncio.Task[None]) -> None:
+        self._sync_task = None
+
+    async def _pull_changes(self) -> None:
+        started = time.monotonic()
+        await asyncio.sleep(_SYNC_DELAY)
+        pulled_at = time.monotonic()
+        self._pull_started += 1
+        generation = self._pull_started
+        count = 0
+        async for change in self._drive.sync():
+            count += 1
+            dispatch_change(
+                change,
+                on_remove=lambda _: None,
+                on_update=self._notify_update,
+            )
+        self._synced_at = pulled_at
+        self._pull_finished = generation
+        self._sync_count += 1
+        elapsed = time.monotonic() - started
+        self._sync_seconds += elapsed
+        _L.info(f"sync {count} in {elapsed:.1f}s (total {self._sync_count})")
+
+    def _notify_update(self, node: Node) -> None:
+        for arrived in self._waiters.get(node.id, ()):
+            arrived.set()
 
     @override
     async def ensure_entry_exists(self, entry: Node) -> None:
-        while True:
-            try:
-                await self._drive.resolve_path(entry)
-                break
-            except NodeNotFoundError:
-                _L.info("not in cache")
-            except Exception:
-                _L.exception("error on updating local cache")
-            await self.sync()
+        started = time.monotonic()
+        arrived = asyncio.Event()
+        waiters = self._waiters.setdefault(entry.id, set())
+        waiters.add(arrived)
+        try:
+            async with asyncio.timeout(self._materialize_timeout):
+                await self._wait_for_entry(entry, arrived)
+        except TimeoutError as e:
+            raise UploadError(
+                f"{entry.name} is not in cache after {self._materialize_timeout}s"
+            ) from e
+        finally:
+            waiters.discard(arrived)
+            if not waiters:
+                del self._waiters[entry.id]
+
+        elapsed = time.monotonic() - started
+        self._materialize_count += 1
+        self._materialize_seconds += elapsed
+        _L.debug(f"{entry.name} is in cache after {elapsed:.1f}s")
+
+    async def _wait_for_entry(self, entry: Node, arrived: asyncio.Event) -> None:
+        delay = _BACKOFF_INITIAL
+        while not await self._is_in_cache(entry):
+            arrived.clear()
+            # Must not be skipped by the freshness window.
+            await self._sync_once()
+            if arrived.is_set():
+                continue
+            # Anyone else's sync may bring the change in the meantime.
+            with suppress(TimeoutError):
+                async with asyncio.timeout(delay):
+                    await arrived.wait()
+            delay = min(delay * 2, _BACKOFF_MAX)
+
+    async def _is_in_cache(self, entry: Node) -> bool:
+        try:
+            await self._drive.resolve_path(entry)
+            return True
+        except NodeNotFoundError:
+            _L.info("not in cache")
+        except Exception:
+            _L.exception("error on updating local cache")
+        return False
 
     @override
     async def is_trashed(self, entry: Node) -> bool:
@@ -122,15 +300,63 @@ class DriveBackend(StorageBackend[Node]):
         return entry.is_directory
 
 
+def _read_and_hash(
+    local_path: Path, create_hasher: CreateHasher, send: Callable[[bytes | None], bool]
+) -> str:
+    """
+    Hands every chunk to `send` after hashing it, then None. Stops early when
+    `send` returns False.
+    """
+
+    async def run() -> str:
+        hasher = await create_hasher()
+        try:
+            with local_path.open("rb") as fin:
+                while chunk := fin.read(_CHUNK_SIZE):
+                    await hasher.update(chunk)
+                    if not send(chunk):
+                        break
+        finally:
+            send(None)
+        return await hasher.hexdigest()
+
+    return asyncio.run(run())
+
+
+def _get_file_info(local_path: Path) -> tuple[str, MediaInfo | None]:
+    return get_mime_type(local_path), get_media_info(local_path)
+
+
+def _create_pool(workers: int | None) -> Executor:
+    if not workers:
+        return create_executor()
+    return ProcessPoolExecutor(max_workers=workers, initializer=_initialize_worker)
+
+
+def _initialize_worker() -> None:
+    from signal import SIG_IGN, SIGINT, signal
+
+    signal(SIGINT, SIG_IGN)
+
+
 @asynccontextmanager
 async def create_drive_backend(upload_data: UploadData):
     kwargs = upload_data.kwargs or {}
     config_path = kwargs["config_path"]
     upload_to = PurePath(kwargs["upload_to"])
+    sync_interval = float(kwargs.get("sync_interval", 0))
+    materialize_timeout = float(kwargs.get("materialize_timeout", 600))
+    workers = kwargs.get("workers", None)
 
     async with AsyncExitStack() as stack:
-        pool = stack.enter_context(create_executor())
+        pool = stack.enter_context(_create_pool(workers))
         drive = await stack.enter_async_context(
             create_drive_from_config(Path(config_path))
         )
-        yield DriveBackend(pool=pool, drive=drive, upload_to=upload_to)
+        yield DriveBackend(
+            pool=pool,
+            drive=drive,
+            upload_to=upload_to,
+            sync_interval=sync_interval,
+            materialize_timeout=materialize_timeout,
+        )
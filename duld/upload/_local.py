@@ -1,14 +1,63 @@
+import asyncio
+import errno
+import hashlib
+import os
 import shutil
 from pathlib import Path, PurePath
-from typing import override
+from typing import BinaryIO, Literal, override
 
+from ..progress import current_progress
 from ..settings import UploadData
 from ._core import HashError, StorageBackend, UploadError
 
 
+# linux/fs.h, share extents between files on btrfs/xfs
+_FICLONE = 0x40049409
+# errors meaning the fast path is not available for this pair of files
+_UNSUPPORTED = frozenset(
+    [
+        errno.EXDEV,
+        errno.ENOSYS,
+        errno.EINVAL,
+        errno.EOPNOTSUPP,
+        errno.ENOTTY,
+        errno.EBADF,
+    ]
+)
+
+
+_CHUNK_SIZE = 1024 * 1024
+
+type VerifyMode = Literal["size", "mtime", "sample", "full"]
+
+
 class LocalBackend(StorageBackend[Path]):
-    def __init__(self, *, upload_to: Path) -> None:
+    """
+    `verify` trades speed for safety:
+    - size: compare sizes only
+    - mtime: also compare modification times, copies keep them
+    - sample: also hash the first, middle and last `sample_size` bytes
+    - full: also hash the whole files
+    """
+
+    def __init__(
+        self,
+        *,
+        upload_to: Path,
+        move_files: bool = False,
+        verify: VerifyMode = "size",
+        sample_size: int = 4 * 1024 * 1024,
+    ) -> None:
         self._upload_to = upload_to
+        self._move_files = move_files
+        self._verify = verify
+        self._sample_size = sample_size
+        # Sizes of moved sources, which no longer exist for verify_file.
+        self._moved_sizes: dict[Path, int] = {}
+
+    @override
+    def get_id(self, entry: Path) -> Path:
+        return entry
 
     @override
     async def get_root_folder(self) -> Path:
@@ -28,26 +77,73 @@ class LocalBackend(StorageBackend[Path]):
     @override
     async def upload_file(self, local_path: Path, parent: Path, *, name: str) -> Path:
         dest = parent / name
-        shutil.copy2(local_path, dest)
+        size = local_path.stat().st_size
+        if self._move_files:
+            if await asyncio.to_thread(_move_file, local_path, dest):
+                self._moved_sizes[dest] = size
+                current_progress().bytes_done += size
+                return dest
+        await asyncio.to_thread(_copy_file, local_path, dest)
+        current_progress().bytes_done += size
         return dest
 
     @override
     async def verify_file(
         self, local_path: Path, entry: Path, remote_path: PurePath
     ) -> None:
-        local_size = local_path.stat().st_size
+        moved_size = self._moved_sizes.pop(entry, None)
+        if moved_size is None:
+            local_size = local_path.stat().st_size
+        else:
+            local_size = moved_size
         remote_size = entry.stat().st_size
         if local_size != remote_size:
             raise HashError(
                 f"{remote_path} size mismatch: local={local_size}, remote={remote_size}"
             )
+        if moved_size is not None:
+            # Same inode as the source, nothing else to compare.
+            return
+
+        match self._verify:
+            case "size":
+                return
+            case "mtime":
+                self._verify_mtime(local_path, entry, remote_path)
+            case "sample":
+                await self._verify_hash(local_path, entry, remote_path, sample=True)
+            case "full":
+                await self._verify_hash(local_path, entry, remote_path, sample=False)
+
+    def _verify_mtime(
+        self, local_path: Path, entry: Path, remote_path: PurePath
+    ) -> None:
+        local_mtime = local_path.stat().st_mtime_ns
+        remote_mtime = entry.stat().st_mtime_ns
+        if local_mtime != remote_mtime:
+            raise HashError(
+                f"{remote_path} mtime mismatch: local={local_mtime}, remote={remote_mtime}"
+            )
+
+    async def _verify_hash(
+        self, local_path: Path, entry: Path, remote_path: PurePath, *, sample: bool
+    ) -> None:
+        sample_size = self._sample_size if sample else None
+        local_hash, remote_hash = await asyncio.gather(
+            asyncio.to_thread(_hash_file, local_path, sample_size),
+            asyncio.to_thread(_hash_file, entry, sample_size),
+        )
+        if local_hash != remote_hash:
+            raise HashError(
+                f"{remote_path} has a different hash ({local_hash}, {remote_hash})"
+            )
 
     @override
     async def resolve_path(self, entry: Path) -> PurePath:
         return PurePath(entry)
 
     @override
-    async def sync(self) -> None:
+    async def sync(self, *, force: bool = False) -> None:
         pass
 
     @override
@@ -64,7 +160,94 @@ class LocalBackend(StorageBackend[Path]):
         return entry.is_dir()
 
 
+def _move_file(src: Path, dst: Path) -> bool:
+    try:
+        os.rename(src, dst)
+        return True
+    except OSError as e:
+        if e.errno == errno.EXDEV:
+            return False
+        raise
+
+
+def _copy_file(src: Path, dst: Path) -> None:
+    """
+    Copies with reflink or copy_file_range when the filesystem can, which
+    avoids moving the data through user space.
+    """
+    with src.open("rb") as fin, dst.open("wb") as fout:
+        done = _clone(fin, fout) or _copy_file_range(fin, fout)
+    if not done:
+        # uses sendfile on Linux
+        shutil.copyfile(src, dst)
+    shutil.copystat(src, dst)
+
+
+def _clone(fin: BinaryIO, fout: BinaryIO) -> bool:
+    try:
+        import fcntl
+    except ImportError:
+        return False
+    try:
+        fcntl.ioctl(fout.fileno(), _FICLONE, fin.fileno())
+        return True
+    except OSError as e:
+        if e.errno in _UNSUPPORTED:
+            return False
+        raise
+
+
+def _copy_file_range(fin: BinaryIO, fout: BinaryIO) -> bool:
+    if not hasattr(os, "copy_file_range"):
+        return False
+    size = os.fstat(fin.fileno()).st_size
+    offset = 0
+    while offset < size:
+        try:
+            copied = os.copy_file_range(fin.fileno(), fout.fileno(), size - offset)
+        except OSError as e:
+            if offset == 0 and e.errno in _UNSUPPORTED:
+                return False
+            raise
+        if not copied:
+            if offset == 0:
+                # Some filesystems report 0 instead of an error.
+                return False
+            # The source shrank while we copied it.
+            raise UploadError(f"copy stopped at {offset} of {size} bytes")
+        offset += copied
+    return True
+
+
+def _hash_file(path: Path, sample_size: int | None) -> str:
+    """
+    Hashes the whole file, or only its head, middle and tail blocks if
+    sample_size is given and the file is large enough to skip anything.
+    """
+    hasher = hashlib.blake2b()
+    with path.open("rb") as fin:
+        size = os.fstat(fin.fileno()).st_size
+        if sample_size is None or size <= sample_size * 3:
+            while chunk := fin.read(_CHUNK_SIZE):
+                hasher.update(chunk)
+        else:
+            for offset in (0, (size - sample_size) // 2, size - sample_size):
+                fin.seek(offset)
+                hasher.update(fin.read(sample_size))
+    return hasher.hexdigest()
+
+
 def create_local_backend(upload_data: UploadData) -> LocalBackend:
     kwargs = upload_data.kwargs or {}
     upload_to = Path(kwargs["upload_to"])
-    return LocalBackend(upload_to=upload_to)
+    move_files = bool(kwargs.get("move_files", False))
+    verify = kwargs.get("verify", "size")
+    if verify not in ("size", "mtime", "sample", "full"):
+        raise ValueError(f"unknown verify mode: {verify}")
+    sample_size = int(kwargs.get("verify_sample_mib", 4)) * 1024 * 1024
+    return LocalBackend(
+        upload_to=upload_to,
+        move_files=move_files,
+        verify=verify,
+        sample_size=sample_size,
+    )
@@ -1,7 +1,18 @@
+import asyncio
+import sqlite3
 import unittest
+from contextlib import closing
 from tempfile import TemporaryDirectory
-
-from duld.dfd import _to_pattern, _to_regex_list, create_dfd_client, should_exclude
+from unittest.mock import patch
+
+from duld.dfd import (
+    _combine,
+    _to_pattern,
+    _to_regex_list,
+    create_dfd_client,
+    prune_paths,
+    should_exclude,
+)
 from duld.filters import create_filter_store
 from duld.settings import ExcludeData
 
@@ -68,11 +79,44 @@ class TestShouldExclude(unittest.TestCase):
         self.assertTrue(should_exclude("SAMPLE_FILE", self.filters))
 
 
+class TestPrunePaths(unittest.TestCase):
+    def test_builds_tree_from_relative_paths(self):
+        tree = prune_paths(["a/b/c.mkv", "a/d.mkv", "e.mkv"], [])
+        self.assertEqual(
+            tree, {"a": {"b": {"c.mkv": None}, "d.mkv": None}, "e.mkv": None}
+        )
+
+    def test_excluded_folder_drops_whole_subtree(self):
+        filters = _to_regex_list(["sample"])
+        tree = prune_paths(["a/sample/x.mkv", "a/sample/y/z.mkv", "a/c.mkv"], filters)
+        self.assertEqual(tree, {"a": {"c.mkv": None}})
+
+    def test_excluded_folder_is_checked_once(self):
+        calls = []
+
+        class _Filter:
+            def match(self, name):
+                calls.append(name)
+                return name == "skip" or None
+
+        prune_paths(["skip/a", "skip/b", "skip/c/d"], [_Filter()])  # type: ignore
+        self.assertEqual(calls, ["skip"])
+
+    def test_filters_match_relative_paths(self):
+        filters = _to_regex_list([r"a/extras$"])
+        tree = prune_paths(["a/extras/x.mkv", "b/extras/y.mkv"], filters)
+        self.assertEqual(tree, {"a": {}, "b": {"extras": {"y.mkv": None}}})
+
+    def test_duplicate_paths_are_merged(self):
+        self.assertEqual(prune_paths(["a/b", "a/b"], []), {"a": {"b": None}})
+
+
 class TestCreateDfdClient(unittest.IsolatedAsyncioTestCase):
     async def test_local_dynamic_filters_are_combined_with_static_filters(self):
         with TemporaryDirectory() as tmp:
             dynamic = f"{tmp}/duld.sqlite3"
             store = create_filter_store(dynamic)
+            self.addCleanup(store.close)
             store.create("dynamic")
 
             async with create_dfd_client(
@@ -87,6 +131,7 @@ class TestCreateDfdClient(unittest.IsolatedAsyncioTestCase):
         with TemporaryDirectory() as tmp:
             dynamic = f"{tmp}/duld.sqlite3"
             store = create_filter_store(dynamic)
+            self.addCleanup(store.close)
             store.create("(invalid")
             store.create("valid")
 
@@ -97,3 +142,107 @@ class TestCreateDfdClient(unittest.IsolatedAsyncioTestCase):
 
         self.assertEqual(len(filters), 1)
         self.assertTrue(should_exclude("valid_file", filters))
+
+
+class TestCombine(unittest.TestCase):
+    def test_filters_are_merged_into_one_pattern(self):
+        filters = _combine(_to_regex_list(["sample", r"^\[.*\]", "xyz"]))
+        self.assertEqual(len(filters), 1)
+        self.assertTrue(should_exclude("SAMPLE_file", filters))
+        self.assertTrue(should_exclude("[Fansub] Anime", filters))
+        self.assertTrue(should_exclude("xyz", filters))
+        self.assertFalse(should_exclude("clean_file", filters))
+
+    def test_anchors_stay_local_to_their_alternative(self):
+        filters = _combine(_to_regex_list([r"a$", "b"]))
+        self.assertTrue(should_exclude("a", filters))
+        self.assertTrue(should_exclude("bx", filters))
+        self.assertFalse(should_exclude("ax", filters))
+
+    def test_backreferences_keep_filters_apart(self):
+        filters = _combine(_to_regex_list([r"(a)\1", "b"]))
+        self.assertEqual(len(filters), 2)
+        self.assertTrue(should_exclude("aa", filters))
+        self.assertTrue(should_exclude("b", filters))
+
+    def test_only_backreferences_stay_apart(self):
+        filters = _combine(_to_regex_list([r"(a)\1", "b", "c"]))
+        self.assertEqual(len(filters), 2)
+        self.assertTrue(should_exclude("aa", filters))
+        self.assertTrue(should_exclude("c", filters))
+        self.assertFalse(should_exclude("ab", filters))
+
+    def test_capturing_groups_are_merged(self):
+        filters = _combine(_to_regex_list([r"(sample|extras)$", r"(?P<tag>\[.*\])"]))
+        self.assertEqual(len(filters), 1)
+        self.assertTrue(should_exclude("extras", filters))
+        self.assertTrue(should_exclude("[tag] name", filters))
+
+    def test_duplicate_group_names_keep_filters_apart(self):
+        filters = _combine(_to_regex_list([r"(?P<x>a)", r"(?P<x>b)"]))
+        self.assertEqual(len(filters), 2)
+        self.assertTrue(should_exclude("b", filters))
+
+
+class TestFetchFiltersCache(unittest.IsolatedAsyncioTestCase):
+    async def test_filters_are_reused_until_store_changes(self):
+        with TemporaryDirectory() as tmp:
+            dynamic = f"{tmp}/duld.sqlite3"
+            store = create_filter_store(dynamic)
+            self.addCleanup(store.close)
+            created = store.create("first")
+
+            async with create_dfd_client(
+                ExcludeData(static=["static"], dynamic=dynamic), store=store
+            ) as client:
+                filters = await client.fetch_filters()
+                self.assertIs(await client.fetch_filters(), filters)
+
+                store.update(created.id, "second")
+                filters = await client.fetch_filters()
+                self.assertFalse(should_exclude("first_file", filters))
+                self.assertTrue(should_exclude("second_file", filters))
+
+                store.delete(created.id)
+                filters = await client.fetch_filters()
+                self.assertFalse(should_exclude("second_file", filters))
+                self.assertTrue(should_exclude("static_file", filters))
+
+    async def test_fetch_does_not_read_database(self):
+        with TemporaryDirectory() as tmp:
+            dynamic = f"{tmp}/duld.sqlite3"
+            store = create_filter_store(dynamic)
+            self.addCleanup(store.close)
+            store.create("first")
+
+            async with create_dfd_client(
+                ExcludeData(static=None, dynamic=dynamic), store=store
+            ) as client:
+                with patch.object(store, "regexps") as regexps:
+                    filters = await client.fetch_filters()
+                regexps.assert_not_called()
+
+        self.assertTrue(should_exclude("first_file", filters))
+
+    async def test_external_edits_are_picked_up(self):
+        with TemporaryDirectory() as tmp:
+            dynamic = f"{tmp}/duld.sqlite3"
+            store = create_filter_store(dynamic)
+            self.addCleanup(store.close)
+
+            with patch("duld.dfd.POLL_INTERVAL", 0.01):
+                async with create_dfd_client(
+                    ExcludeData(static=None, dynamic=dynamic), store=store
+                ) as client:
+                    with closing(sqlite3.connect(dynamic)) as conn:
+                        with conn:
+                            conn.execute(
+                                "INSERT INTO filters (regexp) VALUES ('external')"
+                            )
+                    for _ in range(100):
+                        filters = await client.fetch_filters()
+                        if should_exclude("external_file", filters):
+                            break
+                        await asyncio.sleep(0.01)
+
+        self.assertTrue(should_exclude("external_file", filters))
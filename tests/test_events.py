@@ -0,0 +1,171 @@
+import asyncio
+import json
+import unittest
+from unittest.mock import patch
+
+from aiohttp import ClientSession
+from aiohttp.test_utils import AioHTTPTestCase
+from aiohttp.web import Application, AppRunner, TCPSite
+
+from duld.api import JobEventsHandler
+from duld.events import ProgressBroadcaster
+from duld.keys import EVENTS
+from duld.main import _close_events
+from duld.progress import JobProgress
+
+
+def _parse(event: str | None) -> tuple[str, dict]:
+    assert event
+    name, data = event.strip().split("\n")
+    return name.removeprefix("event: "), json.loads(data.removeprefix("data: "))
+
+
+class TestProgressBroadcaster(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.jobs: list[JobProgress] = []
+        self.broadcaster = ProgressBroadcaster(lambda: self.jobs, queue_size=2)
+
+    async def test_snapshot_first(self):
+        self.jobs.append(JobProgress("torrent:1", "torrent"))
+        with self.broadcaster.subscribe() as queue:
+            name, data = _parse(queue.get_nowait())
+        self.assertEqual(name, "snapshot")
+        self.assertEqual([_["key"] for _ in data["jobs"]], ["torrent:1"])
+
+    async def test_only_changed_jobs_are_sent(self):
+        a = JobProgress("torrent:1", "torrent")
+        b = JobProgress("torrent:2", "torrent")
+        self.jobs.extend([a, b])
+        with self.broadcaster.subscribe() as queue:
+            queue.get_nowait()
+            a.start()
+            a.bytes_done = 10
+            a.bytes_done = 20
+            self.broadcaster.publish()
+            name, data = _parse(queue.get_nowait())
+        self.assertEqual(name, "progress")
+        self.assertEqual(len(data["jobs"]), 1)
+        self.assertEqual(data["jobs"][0]["bytes_done"], 20)
+        self.assertEqual(data["removed"], [])
+
+    async def test_nothing_sent_without_changes(self):
+        a = JobProgress("torrent:1", "torrent")
+        a.start()
+        self.jobs.append(a)
+        with self.broadcaster.subscribe() as queue:
+            queue.get_nowait()
+            # throughput still moves, but it is not a change on its own
+            self.broadcaster.publish()
+            self.assertTrue(queue.empty())
+
+    async def test_ended_jobs_are_sent_before_removal(self):
+        a = JobProgress("torrent:1", "torrent")
+        a.start()
+        self.jobs.append(a)
+        with self.broadcaster.subscribe() as queue:
+            queue.get_nowait()
+            a.fail()
+            self.broadcaster.publish()
+            _, data = _parse(queue.get_nowait())
+        self.assertEqual(data["jobs"][0]["state"], "failed")
+        self.assertEqual(data["removed"], [])
+
+    async def test_finished_jobs_are_removed(self):
+        self.jobs.append(JobProgress("torrent:1", "torrent"))
+        with self.broadcaster.subscribe() as queue:
+            queue.get_nowait()
+            self.jobs.clear()
+            self.broadcaster.publish()
+            _, data = _parse(queue.get_nowait())
+        self.assertEqual(data["jobs"], [])
+        self.assertEqual(data["removed"], ["torrent:1"])
+
+    async def test_slow_client_is_dropped(self):
+        a = JobProgress("torrent:1", "torrent")
+        self.jobs.append(a)
+        with self.broadcaster.subscribe() as slow, self.broadcaster.subscribe() as fast:
+            for i in range(3):
+                a.bytes_done = i + 1
+                self.broadcaster.publish()
+                while not fast.empty():
+                    fast.get_nowait()
+            self.assertIsNone(slow.get_nowait())
+            self.assertTrue(slow.empty())
+
+            a.bytes_done = 100
+            self.broadcaster.publish()
+            self.assertTrue(slow.empty())
+            _, data = _parse(fast.get_nowait())
+            self.assertEqual(data["jobs"][0]["bytes_done"], 100)
+
+    async def test_close_ends_every_stream(self):
+        with self.broadcaster.subscribe() as queue:
+            queue.get_nowait()
+            self.broadcaster.close()
+            self.assertIsNone(queue.get_nowait())
+        with self.broadcaster.subscribe() as queue:
+            self.assertIsNone(queue.get_nowait())
+
+
+class TestJobEventsApi(AioHTTPTestCase):
+    async def get_application(self):
+        self.jobs: list[JobProgress] = []
+        self.broadcaster = ProgressBroadcaster(lambda: self.jobs)
+        app = Application()
+        app[EVENTS] = self.broadcaster
+        app.router.add_view(r"/api/v1/jobs/events", JobEventsHandler)
+        return app
+
+    async def _read_snapshot(self, response):
+        self.assertEqual(await response.content.readline(), b"event: snapshot\n")
+        await response.content.readline()
+        await response.content.readline()
+
+    async def test_stream(self):
+        a = JobProgress("hah:/a", "hah")
+        self.jobs.append(a)
+        async with self.client.get("/api/v1/jobs/events") as response:
+            self.assertEqual(response.status, 200)
+            self.assertEqual(response.content_type, "text/event-stream")
+            await self._read_snapshot(response)
+
+            a.files_done = 1
+            self.broadcaster.publish()
+            self.assertEqual(await response.content.readline(), b"event: progress\n")
+            data = await response.content.readline()
+            payload = json.loads(data.removeprefix(b"data: "))
+            self.assertEqual(payload["jobs"][0]["files_done"], 1)
+
+    async def test_idle_stream_gets_keepalive(self):
+        with patch("duld.api.KEEPALIVE_INTERVAL", 0.01):
+            async with self.client.get("/api/v1/jobs/events") as response:
+                await self._read_snapshot(response)
+                self.assertEqual(await response.content.readline(), b": keepalive\n")
+
+    async def test_close_ends_open_stream(self):
+        async with self.client.get("/api/v1/jobs/events") as response:
+            await self._read_snapshot(response)
+            self.broadcaster.close()
+            async with asyncio.timeout(5):
+                self.assertEqual(await response.content.read(), b"")
+
+
+class TestShutdownWithOpenStream(unittest.IsolatedAsyncioTestCase):
+    async def test_shutdown_does_not_wait_for_clients(self):
+        app = Application()
+        app[EVENTS] = ProgressBroadcaster(list)
+        app.on_shutdown.append(_close_events)
+        app.router.add_view(r"/api/v1/jobs/events", JobEventsHandler)
+        runner = AppRunner(app, shutdown_timeout=60)
+        await runner.setup()
+        site = TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = runner.addresses[0][1]
+
+        async with ClientSession() as session:
+            async with session.get(
+                f"http://127.0.0.1:{port}/api/v1/jobs/events"
+            ) as response:
+                await response.content.readline()
+                async with asyncio.timeout(5):
+                    await runner.cleanup()
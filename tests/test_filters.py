@@ -1,6 +1,11 @@
+import asyncio
+import sqlite3
 import unittest
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
 from pathlib import Path
 from tempfile import TemporaryDirectory
+from unittest.mock import patch
 
 from aiohttp.test_utils import AioHTTPTestCase
 from aiohttp.web import Application
@@ -20,6 +25,7 @@ class TestFilterStore(unittest.TestCase):
         self.store = create_filter_store(f"{self._tmp.name}/duld.sqlite3")
 
     def tearDown(self):
+        self.store.close()
         self._tmp.cleanup()
 
     def test_create_initializes_database(self):
@@ -74,12 +80,86 @@ class TestFilterStore(unittest.TestCase):
 
     def test_store_path_is_used_directly(self):
         store = create_filter_store(f"{self._tmp.name}/nested/duld.sqlite3")
+        self.addCleanup(store.close)
 
         store.create("abc")
 
         self.assertEqual(store.list()[0].regexp, "abc")
         self.assertTrue(Path(self._tmp.name, "nested", "duld.sqlite3").exists())
 
+    def test_database_uses_wal_journal(self):
+        with closing(sqlite3.connect(f"{self._tmp.name}/duld.sqlite3")) as conn:
+            (mode,) = conn.execute("PRAGMA journal_mode").fetchone()
+        self.assertEqual(mode, "wal")
+
+    def test_connection_is_reused(self):
+        with patch("sqlite3.connect", wraps=sqlite3.connect) as connect:
+            store = create_filter_store(f"{self._tmp.name}/other.sqlite3")
+            store.create("abc")
+            store.list()
+            store.delete(1)
+            store.close()
+        connect.assert_called_once()
+
+    def test_listeners_get_regexps_after_writes(self):
+        seen = []
+        self.store.add_listener(seen.append)
+
+        created = self.store.create("abc")
+        self.store.create("def")
+        self.store.update(created.id, "xyz")
+        self.store.delete(created.id)
+
+        self.assertEqual(seen, [["abc"], ["abc", "def"], ["xyz", "def"], ["def"]])
+
+    def test_listeners_are_called_after_commit(self):
+        seen = []
+
+        def read_committed(regexps):
+            # Another connection only sees committed rows.
+            with closing(sqlite3.connect(f"{self._tmp.name}/duld.sqlite3")) as conn:
+                rows = conn.execute("SELECT regexp FROM filters ORDER BY id")
+                seen.append([_ for (_,) in rows])
+
+        self.store.add_listener(read_committed)
+        created = self.store.create("abc")
+        self.store.update(created.id, "xyz")
+        self.store.delete(created.id)
+
+        self.assertEqual(seen, [["abc"], ["xyz"], []])
+
+    def test_failed_write_does_not_notify(self):
+        self.store.create("abc")
+        seen = []
+        self.store.add_listener(seen.append)
+
+        with self.assertRaises(DuplicateFilterError):
+            self.store.create("abc")
+
+        self.assertEqual(seen, [])
+
+    def test_refresh_picks_up_external_commits(self):
+        seen = []
+        self.store.add_listener(seen.append)
+        self.assertFalse(self.store.refresh())
+
+        with closing(sqlite3.connect(f"{self._tmp.name}/duld.sqlite3")) as conn:
+            with conn:
+                conn.execute("INSERT INTO filters (regexp) VALUES ('abc')")
+
+        self.assertTrue(self.store.refresh())
+        self.assertFalse(self.store.refresh())
+        self.assertEqual(seen, [["abc"]])
+
+    def test_own_writes_are_not_refreshed_again(self):
+        self.store.create("abc")
+        self.assertFalse(self.store.refresh())
+
+    def test_store_can_be_used_from_other_threads(self):
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            created = list(pool.map(self.store.create, ["a", "b", "c", "d"]))
+        self.assertEqual(self.store.list(), sorted(created, key=lambda _: _.id))
+
 
 class TestFiltersApi(AioHTTPTestCase):
     async def asyncSetUp(self):
@@ -94,6 +174,7 @@ class TestFiltersApi(AioHTTPTestCase):
         app = Application()
         store = create_filter_store(f"{self._tmp.name}/duld.sqlite3")
         app[FILTER_STORE] = store
+        app.on_cleanup.append(lambda _: asyncio.to_thread(store.close))
         app.router.add_view(r"/api/v1/filters", FiltersHandler)
         app.router.add_view(r"/api/v1/filters/{filter_id:\d+}", FiltersHandler)
         return app
@@ -17,9 +17,11 @@ class _FakeTaskManager:
     def __init__(self, accepted: bool):
         self.accepted = accepted
         self.calls = []
+        self.args = []
 
-    def create_once(self, key, coro_factory):
+    def create_once(self, key, coro_factory, *, args=None):
         self.calls.append((key, coro_factory))
+        self.args.append(args)
         return self.accepted
 
 
@@ -174,11 +176,13 @@ class TestScheduleUploadHah(unittest.TestCase):
         accepted = schedule_upload_hah(
             task_manager=manager,
             uploader=uploader,
+            compressor=object(),
             src_path=src_path,
         )
 
         self.assertTrue(accepted)
         self.assertEqual(manager.calls[0][0], ("hah", src_path.resolve()))
+        self.assertEqual(manager.args[0], {"path": "/tmp/gallery"})
 
     def test_skips_duplicate_hah_upload(self):
         manager = _FakeTaskManager(False)
@@ -188,6 +192,7 @@ class TestScheduleUploadHah(unittest.TestCase):
         accepted = schedule_upload_hah(
             task_manager=manager,
             uploader=uploader,
+            compressor=object(),
             src_path=src_path,
         )
 
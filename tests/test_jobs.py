@@ -0,0 +1,114 @@
+import asyncio
+import sqlite3
+import unittest
+from contextlib import closing
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest.mock import patch
+
+from duld.jobs import JobStore, create_job_store
+
+
+class TestJobStore(unittest.TestCase):
+    def setUp(self):
+        self._tmp = TemporaryDirectory()
+        self.store = JobStore(Path(self._tmp.name, "jobs.sqlite3"))
+        self.store.init()
+
+    def tearDown(self):
+        self.store.close()
+        self._tmp.cleanup()
+
+    def test_nothing_is_written_before_flush(self):
+        self.store.put('["torrent", 1]', "torrent", {"torrent_id": 1})
+        self.assertEqual(self.store.list(), [])
+
+        self.store.flush()
+        jobs = self.store.list()
+        self.assertEqual(len(jobs), 1)
+        self.assertEqual(jobs[0].kind, "torrent")
+        self.assertEqual(jobs[0].args, {"torrent_id": 1})
+        self.assertEqual(jobs[0].state, "pending")
+
+    def test_changes_are_committed_together(self):
+        for i in range(100):
+            self.store.put(f"k{i}", "link", {"url": str(i)})
+        statements = []
+        self.store._connect().set_trace_callback(statements.append)
+
+        self.store.flush()
+
+        self.assertEqual(statements.count("COMMIT"), 1)
+        self.assertEqual(len(self.store.list()), 100)
+
+    def test_start_counts_attempts(self):
+        self.store.put("k", "hah", {"path": "/a"})
+        self.store.start("k")
+        self.store.flush()
+        job = self.store.list()[0]
+        self.assertEqual(job.state, "running")
+        self.assertEqual(job.attempts, 1)
+
+    def test_requeue_does_not_count_attempt(self):
+        self.store.put("k", "hah", {"path": "/a"})
+        self.store.start("k")
+        self.store.requeue("k")
+        self.store.flush()
+        job = self.store.list()[0]
+        self.assertEqual(job.state, "pending")
+        self.assertEqual(job.attempts, 0)
+
+    def test_put_again_keeps_attempts(self):
+        self.store.put("k", "hah", {"path": "/a"})
+        self.store.start("k")
+        self.store.put("k", "hah", {"path": "/b"})
+        self.store.flush()
+        job = self.store.list()[0]
+        self.assertEqual(job.args, {"path": "/b"})
+        self.assertEqual(job.state, "pending")
+        self.assertEqual(job.attempts, 1)
+
+    def test_remove(self):
+        self.store.put("k", "hah", {"path": "/a"})
+        self.store.remove("k")
+        self.store.flush()
+        self.assertEqual(self.store.list(), [])
+
+    def test_close_flushes(self):
+        self.store.put("k", "hah", {"path": "/a"})
+        self.store.close()
+        with closing(sqlite3.connect(Path(self._tmp.name, "jobs.sqlite3"))) as conn:
+            (count,) = conn.execute("SELECT COUNT(*) FROM jobs").fetchone()
+        self.assertEqual(count, 1)
+
+
+class TestCreateJobStore(unittest.IsolatedAsyncioTestCase):
+    async def test_changes_are_flushed_in_background(self):
+        with TemporaryDirectory() as tmp:
+            with patch("duld.jobs.COMMIT_DELAY", 0):
+                async with create_job_store(f"{tmp}/jobs.sqlite3") as store:
+                    store.put("k", "hah", {"path": "/a"})
+                    for _ in range(100):
+                        await asyncio.sleep(0.01)
+                        if store.list():
+                            break
+                    self.assertEqual(len(store.list()), 1)
+
+    async def test_writes_from_threads_are_flushed(self):
+        with TemporaryDirectory() as tmp:
+            with patch("duld.jobs.COMMIT_DELAY", 0):
+                async with create_job_store(f"{tmp}/jobs.sqlite3") as store:
+                    await asyncio.to_thread(store.put, "k", "hah", {"path": "/a"})
+                    for _ in range(100):
+                        await asyncio.sleep(0.01)
+                        if store.list():
+                            break
+                    self.assertEqual(len(store.list()), 1)
+
+    async def test_jobs_survive_reopen(self):
+        with TemporaryDirectory() as tmp:
+            async with create_job_store(f"{tmp}/jobs.sqlite3") as store:
+                store.put("k", "hah", {"path": "/a"})
+            async with create_job_store(f"{tmp}/jobs.sqlite3") as store:
+                jobs = store.list()
+        self.assertEqual([_.key for _ in jobs], ["k"])
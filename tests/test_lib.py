@@ -0,0 +1,177 @@
+import asyncio
+import unittest
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest.mock import patch
+
+from duld.lib import (
+    Compressor,
+    compress_to_path,
+    create_compressor,
+    is_compressed_content,
+)
+from duld.settings import CompressData
+
+
+class _FakeProcess:
+    def __init__(self, out_path: Path, gate: asyncio.Event | None = None):
+        self._out_path = out_path
+        self._gate = gate
+
+    async def wait(self):
+        if self._gate:
+            await self._gate.wait()
+        self._out_path.touch()
+        return 0
+
+
+class TestCompressToPath(unittest.IsolatedAsyncioTestCase):
+    async def test_passes_thread_count(self):
+        calls = []
+
+        async def fake_exec(*cmd, **kwargs):
+            calls.append(cmd)
+            return _FakeProcess(Path(cmd[-2]))
+
+        with TemporaryDirectory() as tmp:
+            with patch("asyncio.create_subprocess_exec", fake_exec):
+                await compress_to_path(Path(tmp), Path(tmp), base_name="a", threads=3)
+        self.assertIn("-mmt3", calls[0])
+
+    async def test_omits_thread_count_by_default(self):
+        calls = []
+
+        async def fake_exec(*cmd, **kwargs):
+            calls.append(cmd)
+            return _FakeProcess(Path(cmd[-2]))
+
+        with TemporaryDirectory() as tmp:
+            with patch("asyncio.create_subprocess_exec", fake_exec):
+                await compress_to_path(Path(tmp), Path(tmp), base_name="a")
+        self.assertFalse(any(_.startswith("-mmt") for _ in calls[0]))
+
+    async def test_auto_profile_stores_images(self):
+        calls = []
+
+        async def fake_exec(*cmd, **kwargs):
+            calls.append(cmd)
+            return _FakeProcess(Path(cmd[-2]))
+
+        with TemporaryDirectory() as tmp:
+            src = Path(tmp, "src")
+            src.mkdir()
+            (src / "001.jpg").write_bytes(b"x" * 100)
+            with patch("asyncio.create_subprocess_exec", fake_exec):
+                await compress_to_path(src, Path(tmp), base_name="a", profile="auto")
+        self.assertIn("-mx0", calls[0])
+
+    async def test_fast_profile(self):
+        calls = []
+
+        async def fake_exec(*cmd, **kwargs):
+            calls.append(cmd)
+            return _FakeProcess(Path(cmd[-2]))
+
+        with TemporaryDirectory() as tmp:
+            with patch("asyncio.create_subprocess_exec", fake_exec):
+                await compress_to_path(
+                    Path(tmp), Path(tmp), base_name="a", profile="fast"
+                )
+        self.assertIn("-mx1", calls[0])
+
+
+class TestIsCompressedContent(unittest.TestCase):
+    def setUp(self):
+        self._tmp = TemporaryDirectory()
+        self.root = Path(self._tmp.name)
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def test_images_are_compressed(self):
+        (self.root / "001.avif").write_bytes(b"x" * 1000)
+        (self.root / "002.PNG").write_bytes(b"x" * 1000)
+        (self.root / "galleryinfo.txt").write_bytes(b"x" * 10)
+        self.assertTrue(is_compressed_content(self.root))
+
+    def test_text_is_not_compressed(self):
+        (self.root / "001.jpg").write_bytes(b"x" * 100)
+        (self.root / "book.txt").write_bytes(b"x" * 1000)
+        self.assertFalse(is_compressed_content(self.root))
+
+    def test_nested_files_are_sampled(self):
+        sub = self.root / "sub"
+        sub.mkdir()
+        (sub / "001.webp").write_bytes(b"x" * 1000)
+        self.assertTrue(is_compressed_content(self.root))
+
+    def test_empty_folder_is_not_compressed(self):
+        self.assertFalse(is_compressed_content(self.root))
+
+
+class TestCompressor(unittest.IsolatedAsyncioTestCase):
+    async def test_limits_running_processes_and_reports_queue(self):
+        gate = asyncio.Event()
+        started = 0
+
+        async def fake_exec(*cmd, **kwargs):
+            nonlocal started
+            started += 1
+            return _FakeProcess(Path(cmd[-2]), gate)
+
+        compressor = Compressor(max_jobs=2, threads=1)
+        with TemporaryDirectory() as tmp:
+            work = Path(tmp)
+            with patch("asyncio.create_subprocess_exec", fake_exec):
+                tasks = [
+                    asyncio.create_task(
+                        compressor.compress(work, work, base_name=str(_), kind="hah")
+                    )
+                    for _ in range(5)
+                ]
+                with patch("duld.lib._L") as logger:
+                    await asyncio.sleep(0.01)
+                self.assertEqual(started, 2)
+                self.assertEqual(compressor.queue_depth, 3)
+                self.assertIn("3 waiting", logger.info.call_args.args[0])
+
+                gate.set()
+                await asyncio.gather(*tasks)
+        self.assertEqual(started, 5)
+        self.assertEqual(compressor.queue_depth, 0)
+
+
+class TestCreateCompressor(unittest.TestCase):
+    def test_profiles_by_kind(self):
+        compressor = create_compressor(
+            CompressData(
+                max_jobs=None, threads=None, hah="store", torrent=None, work_dir=None
+            )
+        )
+        self.assertEqual(compressor._profiles, {"hah": "store"})
+
+    def test_splits_threads_between_jobs(self):
+        compressor = create_compressor(
+            CompressData(max_jobs=2, threads=8, hah=None, torrent=None, work_dir=None)
+        )
+        self.assertEqual(compressor._threads, 4)
+
+    def test_defaults_to_cpu_count(self):
+        with patch("os.cpu_count", return_value=6):
+            compressor = create_compressor(None)
+        self.assertEqual(compressor._threads, 3)
+
+    def test_single_cpu(self):
+        with patch("os.cpu_count", return_value=1):
+            compressor = create_compressor(None)
+        self.assertEqual(compressor._threads, 1)
+
+    def test_work_dir_is_used_for_temporary_directory(self):
+        with TemporaryDirectory() as tmp:
+            compressor = create_compressor(
+                CompressData(
+                    max_jobs=None, threads=None, hah=None, torrent=None, work_dir=tmp
+                )
+            )
+            with compressor.temporary_directory() as work:
+                self.assertEqual(Path(work).parent, Path(tmp))
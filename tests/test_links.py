@@ -0,0 +1,125 @@
+import unittest
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from aiohttp import ClientSession
+from aiohttp.test_utils import AioHTTPTestCase
+from aiohttp.web import Application, Request, Response, StreamResponse
+
+from duld.links import DownloadError, download_retry, schedule_upload_from_url
+from duld.tasks import UploadTaskManager
+
+
+_BODY = bytes(range(256)) * 1024
+
+
+class TestDownloadRetry(AioHTTPTestCase):
+    async def asyncSetUp(self):
+        self._tmp = TemporaryDirectory()
+        self.path = Path(self._tmp.name) / "file.bin"
+        self.ranges: list[str | None] = []
+        self.broken = 0
+        await super().asyncSetUp()
+
+    async def asyncTearDown(self):
+        await super().asyncTearDown()
+        self._tmp.cleanup()
+
+    async def get_application(self):
+        app = Application()
+        app.router.add_get("/file", self._serve)
+        app.router.add_get("/no-range", self._serve_no_range)
+        app.router.add_get("/missing", self._serve_missing)
+        return app
+
+    async def _serve(self, request: Request):
+        range_ = request.headers.get("Range")
+        self.ranges.append(range_)
+        offset = int(range_[6:-1]) if range_ else 0
+        if offset >= len(_BODY):
+            return Response(status=416)
+
+        resp = StreamResponse(status=206 if offset else 200)
+        resp.content_length = len(_BODY) - offset
+        await resp.prepare(request)
+        if self.broken:
+            # drop the connection half way
+            self.broken -= 1
+            await resp.write(_BODY[offset : offset + len(_BODY) // 2])
+            assert request.transport
+            request.transport.close()
+            return resp
+        await resp.write(_BODY[offset:])
+        await resp.write_eof()
+        return resp
+
+    async def _serve_no_range(self, request: Request):
+        self.ranges.append(request.headers.get("Range"))
+        return Response(body=_BODY)
+
+    async def _serve_missing(self, request: Request):
+        return Response(status=404)
+
+    async def _download(self, path: str):
+        url = str(self.server.make_url(path))
+        async with ClientSession() as session:
+            await download_retry(session, url, self.path)
+
+    async def test_downloads_whole_body(self):
+        await self._download("/file")
+        self.assertEqual(self.path.read_bytes(), _BODY)
+        self.assertEqual(self.ranges, [None])
+
+    async def test_resumes_interrupted_download(self):
+        self.broken = 1
+        await self._download("/file")
+        self.assertEqual(self.path.read_bytes(), _BODY)
+        self.assertEqual(len(self.ranges), 2)
+        self.assertIsNone(self.ranges[0])
+        self.assertIsNotNone(self.ranges[1])
+
+    async def test_existing_partial_file_is_resumed(self):
+        self.path.write_bytes(_BODY[:1000])
+        await self._download("/file")
+        self.assertEqual(self.path.read_bytes(), _BODY)
+        self.assertEqual(self.ranges, ["bytes=1000-"])
+
+    async def test_complete_file_is_kept(self):
+        self.path.write_bytes(_BODY)
+        await self._download("/file")
+        self.assertEqual(self.path.read_bytes(), _BODY)
+
+    async def test_server_without_range_support_restarts(self):
+        self.path.write_bytes(b"garbage")
+        await self._download("/no-range")
+        self.assertEqual(self.path.read_bytes(), _BODY)
+
+    async def test_gives_up_after_retries(self):
+        with self.assertRaises(DownloadError):
+            await self._download("/missing")
+
+
+class _FakeGroup:
+    def __init__(self):
+        self.coroutines = []
+
+    def create_task(self, coro):
+        self.coroutines.append(coro)
+
+
+class TestScheduleUploadFromUrl(unittest.TestCase):
+    def test_same_url_is_scheduled_once(self):
+        group = _FakeGroup()
+        manager = UploadTaskManager(group)
+
+        first = schedule_upload_from_url(
+            task_manager=manager, uploader=object(), url="http://a/b", name=None
+        )
+        second = schedule_upload_from_url(
+            task_manager=manager, uploader=object(), url="http://a/b", name="c"
+        )
+
+        self.assertTrue(first)
+        self.assertFalse(second)
+        for coro in group.coroutines:
+            coro.close()
@@ -2,9 +2,14 @@ import unittest
 from pathlib import Path
 from tempfile import TemporaryDirectory
 
+import dacite
+
 from duld.settings import load_from_path
 
 
+_EXAMPLE_PATH = Path(__file__).parent.parent / "duld.example.yaml"
+
+
 _MINIMAL_CONFIG = """\
 host: "0.0.0.0"
 port: 8080
@@ -57,6 +62,51 @@ class TestLoadFromPath(unittest.TestCase):
             with self.assertRaises(ValueError):
                 load_from_path(path)
 
+    def test_max_files_per_job_defaults_to_none(self):
+        with TemporaryDirectory() as tmp:
+            path = self._write_config(tmp, _MINIMAL_CONFIG)
+            data = load_from_path(path)
+            self.assertIsNone(data.max_files_per_job)
+
+    def test_max_files_per_job_negative_raises(self):
+        with TemporaryDirectory() as tmp:
+            config = _MINIMAL_CONFIG + "max_files_per_job: -1\n"
+            path = self._write_config(tmp, config)
+            with self.assertRaises(ValueError):
+                load_from_path(path)
+
+    def test_compress_is_loaded(self):
+        with TemporaryDirectory() as tmp:
+            config = _MINIMAL_CONFIG + "compress:\n  max_jobs: 2\n  threads: 8\n"
+            path = self._write_config(tmp, config)
+            data = load_from_path(path)
+            self.assertIsNotNone(data.compress)
+            self.assertEqual(data.compress.max_jobs, 2)
+            self.assertEqual(data.compress.threads, 8)
+
+    def test_compress_profiles_are_loaded(self):
+        with TemporaryDirectory() as tmp:
+            config = _MINIMAL_CONFIG + "compress:\n  hah: auto\n  torrent: store\n"
+            path = self._write_config(tmp, config)
+            data = load_from_path(path)
+            self.assertIsNotNone(data.compress)
+            self.assertEqual(data.compress.hah, "auto")
+            self.assertEqual(data.compress.torrent, "store")
+
+    def test_compress_unknown_profile_raises(self):
+        with TemporaryDirectory() as tmp:
+            config = _MINIMAL_CONFIG + "compress:\n  hah: fastest\n"
+            path = self._write_config(tmp, config)
+            with self.assertRaises(dacite.DaciteError):
+                load_from_path(path)
+
+    def test_compress_zero_jobs_raises(self):
+        with TemporaryDirectory() as tmp:
+            config = _MINIMAL_CONFIG + "compress:\n  max_jobs: 0\n  threads: null\n"
+            path = self._write_config(tmp, config)
+            with self.assertRaises(ValueError):
+                load_from_path(path)
+
     def test_exclude_static_list_is_loaded(self):
         with TemporaryDirectory() as tmp:
             config = _MINIMAL_CONFIG.replace(
@@ -67,3 +117,29 @@ class TestLoadFromPath(unittest.TestCase):
             data = load_from_path(path)
             self.assertIsNotNone(data.exclude)
             self.assertEqual(data.exclude.static, ["pattern1", "pattern2"])
+
+    def test_job_weights_are_loaded(self):
+        with TemporaryDirectory() as tmp:
+            config = _MINIMAL_CONFIG + "job_weights:\n  hah: 2\n"
+            path = self._write_config(tmp, config)
+            data = load_from_path(path)
+            self.assertEqual(data.job_weights, {"hah": 2})
+
+    def test_job_weights_zero_raises(self):
+        with TemporaryDirectory() as tmp:
+            config = _MINIMAL_CONFIG + "job_weights:\n  hah: 0\n"
+            path = self._write_config(tmp, config)
+            with self.assertRaises(ValueError):
+                load_from_path(path)
+
+    def test_max_upload_gb_negative_raises(self):
+        with TemporaryDirectory() as tmp:
+            config = _MINIMAL_CONFIG + "max_upload_gb: -1\n"
+            path = self._write_config(tmp, config)
+            with self.assertRaises(ValueError):
+                load_from_path(path)
+
+    def test_example_config_loads(self):
+        data = load_from_path(str(_EXAMPLE_PATH))
+        self.assertIsNotNone(data.compress)
+        self.assertEqual(data.compress.hah, "auto")
@@ -1,6 +1,18 @@
+import asyncio
 import unittest
+from contextlib import AsyncExitStack, asynccontextmanager
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest.mock import patch
 
-from duld.tasks import UploadTaskManager
+from aiohttp.test_utils import AioHTTPTestCase
+from aiohttp.web import Application
+
+from duld.api import JobsHandler
+from duld.jobs import JobStore, create_job_store
+from duld.keys import TASK_MANAGER
+from duld.progress import JobProgress, current_progress
+from duld.tasks import FairScheduler, UploadTaskManager
 
 
 class _FakeGroup:
@@ -58,3 +70,430 @@ class TestUploadTaskManager(unittest.IsolatedAsyncioTestCase):
 
         self.assertTrue(manager.create_once(("torrent", 1), run))
         await group.coroutines.pop()
+
+
+class TestUploadTaskManagerStore(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self._tmp = TemporaryDirectory()
+        self.store = JobStore(Path(self._tmp.name, "jobs.sqlite3"))
+        self.store.init()
+
+    def tearDown(self):
+        self.store.close()
+        self._tmp.cleanup()
+
+    def _jobs(self):
+        self.store.flush()
+        return self.store.list()
+
+    async def test_job_is_saved_until_it_finishes(self):
+        group = _FakeGroup()
+        manager = UploadTaskManager(group, store=self.store)
+
+        async def run():
+            self.assertEqual(self._jobs()[0].state, "running")
+
+        manager.create_once(("torrent", 1), run, args={"torrent_id": 1})
+        jobs = self._jobs()
+        self.assertEqual(len(jobs), 1)
+        self.assertEqual(jobs[0].kind, "torrent")
+        self.assertEqual(jobs[0].args, {"torrent_id": 1})
+
+        await group.coroutines.pop()
+        self.assertEqual(self._jobs(), [])
+
+    async def test_failed_job_is_removed(self):
+        group = _FakeGroup()
+        manager = UploadTaskManager(group, store=self.store)
+
+        async def fail():
+            raise RuntimeError("boom")
+
+        manager.create_once(("hah", "/a"), fail, args={"path": "/a"})
+        with self.assertRaises(RuntimeError):
+            await group.coroutines.pop()
+        self.assertEqual(self._jobs(), [])
+
+    async def test_cancelled_job_is_kept_for_next_start(self):
+        group = _FakeGroup()
+        manager = UploadTaskManager(group, store=self.store)
+
+        async def run():
+            await asyncio.sleep(10)
+
+        manager.create_once(("link", "u"), run, args={"url": "u", "name": None})
+        task = asyncio.create_task(group.coroutines.pop())
+        await asyncio.sleep(0)
+        task.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await task
+
+        jobs = self._jobs()
+        self.assertEqual(jobs[0].state, "pending")
+        self.assertEqual(jobs[0].attempts, 0)
+
+    async def test_job_scheduled_after_close_is_kept(self):
+        group = _FakeGroup()
+        manager = UploadTaskManager(group, store=self.store)
+        await manager.close()
+
+        async def run():
+            self.fail("must not run")
+
+        manager.create_once(("torrent", 1), run, args={"torrent_id": 1})
+        with self.assertRaises(asyncio.CancelledError):
+            await group.coroutines.pop()
+        jobs = self._jobs()
+        self.assertEqual(jobs[0].state, "pending")
+        self.assertEqual(jobs[0].attempts, 0)
+
+    async def test_jobs_without_args_are_not_saved(self):
+        group = _FakeGroup()
+        manager = UploadTaskManager(group, store=self.store)
+
+        async def run():
+            pass
+
+        manager.create_once(("torrent", 1), run)
+        self.assertEqual(self._jobs(), [])
+        await group.coroutines.pop()
+
+
+class TestShutdown(unittest.IsolatedAsyncioTestCase):
+    async def test_jobs_are_kept_over_restart(self):
+        closed = False
+        started = asyncio.Event()
+
+        @asynccontextmanager
+        async def open_uploader():
+            nonlocal closed
+            try:
+                yield
+            finally:
+                closed = True
+
+        async def run():
+            started.set()
+            # Like upload_by_id, which logs and fails once its clients close.
+            while not closed:
+                await asyncio.sleep(0.01)
+            current_progress().fail()
+
+        with TemporaryDirectory() as tmp:
+            path = f"{tmp}/jobs.sqlite3"
+            # Same order as Daemon._main.
+            async with AsyncExitStack() as stack:
+                store = await stack.enter_async_context(create_job_store(path))
+                group = await stack.enter_async_context(asyncio.TaskGroup())
+                manager = UploadTaskManager(group, store=store, max_jobs=1)
+                await stack.enter_async_context(open_uploader())
+                stack.push_async_callback(manager.close)
+                for i in range(3):
+                    manager.create_once(("torrent", i), run, args={"torrent_id": i})
+                await started.wait()
+
+            async with create_job_store(path) as store:
+                jobs = store.list()
+
+        self.assertEqual([_.state for _ in jobs], ["pending"] * 3)
+        self.assertEqual([_.attempts for _ in jobs], [0] * 3)
+
+
+class TestFairScheduler(unittest.IsolatedAsyncioTestCase):
+    async def _run(self, scheduler, keys, *, first):
+        """
+        Holds the only slot with `first` until all keys are waiting, then
+        returns the order they ran in.
+        """
+        order = []
+        release = asyncio.Event()
+
+        async def job(key):
+            async with scheduler.slot(key):
+                order.append(key)
+                if key == first:
+                    await release.wait()
+
+        async with asyncio.TaskGroup() as group:
+            group.create_task(job(first))
+            await asyncio.sleep(0)
+            for key in keys:
+                group.create_task(job(key))
+            await asyncio.sleep(0)
+            release.set()
+        return order[1:]
+
+    async def test_no_limit_runs_everything_at_once(self):
+        scheduler = FairScheduler(0)
+        running = 0
+        peak = 0
+
+        async def job(key):
+            nonlocal running, peak
+            async with scheduler.slot(key):
+                running += 1
+                peak = max(peak, running)
+                await asyncio.sleep(0)
+                running -= 1
+
+        async with asyncio.TaskGroup() as group:
+            for i in range(5):
+                group.create_task(job(("hah", i)))
+        self.assertEqual(peak, 5)
+
+    async def test_kinds_take_turns(self):
+        scheduler = FairScheduler(1)
+        keys = [("torrent", 1), ("torrent", 2), ("torrent", 3)]
+        keys += [("hah", 1), ("hah", 2), ("hah", 3)]
+        order = await self._run(scheduler, keys, first=("torrent", 0))
+        self.assertEqual(
+            [_[0] for _ in order],
+            ["torrent", "hah", "torrent", "hah", "torrent", "hah"],
+        )
+
+    async def test_weights_share_turns(self):
+        scheduler = FairScheduler(1, weights={"hah": 2})
+        keys = [("torrent", i) for i in range(1, 4)]
+        keys += [("hah", i) for i in range(1, 7)]
+        order = await self._run(scheduler, keys, first=("torrent", 0))
+        self.assertEqual(
+            [_[0] for _ in order[:6]],
+            ["torrent", "hah", "hah", "torrent", "hah", "hah"],
+        )
+
+    async def test_priority_goes_first(self):
+        scheduler = FairScheduler(1)
+        keys = [("torrent", 1), ("hah", 1), ("link", "u")]
+        scheduler.set_priority(("link", "u"), 5)
+        order = await self._run(scheduler, keys, first=("torrent", 0))
+        self.assertEqual(order[0], ("link", "u"))
+
+    async def test_cancelled_waiter_gives_up_its_place(self):
+        scheduler = FairScheduler(1)
+        release = asyncio.Event()
+        order = []
+
+        async def job(key):
+            async with scheduler.slot(key):
+                order.append(key)
+                await release.wait()
+
+        first = asyncio.create_task(job(1))
+        await asyncio.sleep(0)
+        second = asyncio.create_task(job(2))
+        third = asyncio.create_task(job(3))
+        await asyncio.sleep(0)
+        second.cancel()
+        release.set()
+        await asyncio.gather(first, third)
+        self.assertEqual(order, [1, 3])
+
+    async def test_cancel_all_at_once(self):
+        scheduler = FairScheduler(1)
+
+        async def job(key):
+            async with scheduler.slot(key):
+                await asyncio.Event().wait()
+
+        tasks = [asyncio.create_task(job(_)) for _ in range(3)]
+        await asyncio.sleep(0)
+        for task in tasks:
+            task.cancel()
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        self.assertTrue(all(isinstance(_, asyncio.CancelledError) for _ in results))
+        async with asyncio.timeout(1), scheduler.slot(4):
+            pass
+
+
+class TestSetPriority(unittest.IsolatedAsyncioTestCase):
+    async def test_unknown_job_is_rejected(self):
+        manager = UploadTaskManager(_FakeGroup(), max_jobs=1)
+        self.assertFalse(manager.set_priority("torrent:1", 1))
+
+    async def test_job_is_found_by_name(self):
+        group = _FakeGroup()
+        manager = UploadTaskManager(group, max_jobs=1)
+
+        async def run():
+            pass
+
+        manager.create_once(("torrent", 1), run)
+        self.assertTrue(manager.set_priority("torrent:1", 1))
+        await group.coroutines.pop()
+        self.assertFalse(manager.set_priority("torrent:1", 1))
+
+
+class TestJobsApi(AioHTTPTestCase):
+    async def get_application(self):
+        self.group = _FakeGroup()
+        self.manager = UploadTaskManager(self.group, max_jobs=1)
+        app = Application()
+        app[TASK_MANAGER] = self.manager
+        app.router.add_view(r"/api/v1/jobs", JobsHandler)
+        app.router.add_view(r"/api/v1/jobs/{key:.+}", JobsHandler)
+        return app
+
+    async def asyncTearDown(self):
+        for coro in self.group.coroutines:
+            coro.close()
+        await super().asyncTearDown()
+
+    async def test_set_priority(self):
+        async def run():
+            pass
+
+        self.manager.create_once(("hah", "/a/b"), run)
+        response = await self.client.put("/api/v1/jobs/hah:/a/b", json={"priority": 3})
+        self.assertEqual(response.status, 204)
+
+    async def test_unknown_job_returns_not_found(self):
+        response = await self.client.put("/api/v1/jobs/torrent:1", json={"priority": 3})
+        self.assertEqual(response.status, 404)
+
+    async def test_invalid_priority_returns_bad_request(self):
+        for priority in ["high", -1, True, None]:
+            response = await self.client.put(
+                "/api/v1/jobs/torrent:1", json={"priority": priority}
+            )
+            self.assertEqual(response.status, 400)
+
+    async def test_list_jobs(self):
+        async def run():
+            pass
+
+        self.manager.create_once(("torrent", 1), run)
+        response = await self.client.get("/api/v1/jobs")
+        self.assertEqual(response.status, 200)
+        jobs = await response.json()
+        self.assertEqual(len(jobs), 1)
+        self.assertEqual(jobs[0]["key"], "torrent:1")
+        self.assertEqual(jobs[0]["kind"], "torrent")
+        self.assertEqual(jobs[0]["state"], "waiting")
+
+    async def test_get_job(self):
+        async def run():
+            pass
+
+        self.manager.create_once(("hah", "/a/b"), run)
+        response = await self.client.get("/api/v1/jobs/hah:/a/b")
+        self.assertEqual(response.status, 200)
+        self.assertEqual((await response.json())["key"], "hah:/a/b")
+
+    async def test_get_unknown_job_returns_not_found(self):
+        response = await self.client.get("/api/v1/jobs/torrent:1")
+        self.assertEqual(response.status, 404)
+
+
+class TestJobProgress(unittest.IsolatedAsyncioTestCase):
+    async def test_job_sees_its_own_progress(self):
+        group = _FakeGroup()
+        manager = UploadTaskManager(group)
+        seen = []
+
+        async def run():
+            progress = current_progress()
+            progress.bytes_done += 5
+            seen.append(progress)
+
+        manager.create_once(("torrent", 1), run)
+        self.assertEqual(manager.get_progress("torrent:1").state, "waiting")
+        await group.coroutines.pop()
+
+        self.assertEqual(seen[0].name, "torrent:1")
+        self.assertEqual(manager.get_progress("torrent:1").state, "done")
+
+    async def test_failed_job_stays_listed(self):
+        group = _FakeGroup()
+        manager = UploadTaskManager(group)
+
+        async def run():
+            raise RuntimeError("broken")
+
+        manager.create_once(("torrent", 1), run)
+        with self.assertRaises(RuntimeError):
+            await group.coroutines.pop()
+
+        self.assertEqual(
+            [(_.name, _.state) for _ in manager.list_progress()],
+            [("torrent:1", "failed")],
+        )
+
+    async def test_job_can_report_its_own_failure(self):
+        group = _FakeGroup()
+        manager = UploadTaskManager(group)
+
+        async def run():
+            current_progress().fail()
+
+        manager.create_once(("hah", "/a"), run)
+        await group.coroutines.pop()
+        self.assertEqual(manager.get_progress("hah:/a").state, "failed")
+
+    async def test_only_recent_ended_jobs_are_kept(self):
+        group = _FakeGroup()
+        manager = UploadTaskManager(group)
+
+        async def run():
+            pass
+
+        with patch("duld.tasks.KEEP_ENDED", 2):
+            for i in range(3):
+                manager.create_once(("torrent", i), run)
+                await group.coroutines.pop()
+        self.assertEqual(
+            [_.name for _ in manager.list_progress()], ["torrent:1", "torrent:2"]
+        )
+
+    async def test_new_run_replaces_ended_record(self):
+        group = _FakeGroup()
+        manager = UploadTaskManager(group)
+
+        async def run():
+            pass
+
+        manager.create_once(("torrent", 1), run)
+        await group.coroutines.pop()
+        manager.create_once(("torrent", 1), run)
+        self.assertEqual(
+            [(_.name, _.state) for _ in manager.list_progress()],
+            [("torrent:1", "waiting")],
+        )
+        await group.coroutines.pop()
+
+    async def test_cancelled_job_is_not_kept(self):
+        group = _FakeGroup()
+        manager = UploadTaskManager(group)
+
+        async def run():
+            raise asyncio.CancelledError
+
+        manager.create_once(("torrent", 1), run)
+        with self.assertRaises(asyncio.CancelledError):
+            await group.coroutines.pop()
+        self.assertEqual(manager.list_progress(), [])
+
+    def test_eta_from_average_throughput(self):
+        progress = JobProgress("torrent:1", "torrent")
+        progress.bytes_total = 300
+        with patch("duld.progress.time.monotonic", return_value=10):
+            progress.start()
+        progress.bytes_done = 100
+        with patch("duld.progress.time.monotonic", return_value=20):
+            data = progress.to_dict()
+        self.assertEqual(data["throughput"], 10)
+        self.assertEqual(data["eta"], 20)
+
+    def test_throughput_stops_at_end(self):
+        progress = JobProgress("torrent:1", "torrent")
+        with patch("duld.progress.time.monotonic", return_value=10):
+            progress.start()
+        progress.bytes_done = 100
+        with patch("duld.progress.time.monotonic", return_value=20):
+            progress.finish()
+        with patch("duld.progress.time.monotonic", return_value=100):
+            self.assertEqual(progress.get_throughput(), 10)
+
+    def test_waiting_job_has_no_eta(self):
+        data = JobProgress("torrent:1", "torrent").to_dict()
+        self.assertIsNone(data["throughput"])
+        self.assertIsNone(data["eta"])
@@ -1,10 +1,13 @@
 import unittest
 from unittest.mock import MagicMock
 
+from transmission_rpc import Torrent
+
 from duld.torrent import (
+    _get_file_list,
     _get_root_dir,
-    _get_root_items,
-    _split_all,
+    _halt_pending_torrents,
+    get_completed,
     schedule_upload_by_id,
 )
 
@@ -13,80 +16,47 @@ class _FakeTaskManager:
     def __init__(self, accepted: bool):
         self.accepted = accepted
         self.calls = []
+        self.args = []
 
-    def create_once(self, key, coro_factory):
+    def create_once(self, key, coro_factory, *, args=None):
         self.calls.append((key, coro_factory))
+        self.args.append(args)
         return self.accepted
 
 
-class TestSplitAll(unittest.TestCase):
-    def test_single_component(self):
-        self.assertEqual(_split_all("a"), ["a"])
-
-    def test_relative_nested(self):
-        self.assertEqual(_split_all("a/b/c"), ["a", "b", "c"])
-
-    def test_relative_two_parts(self):
-        self.assertEqual(_split_all("a/b"), ["a", "b"])
-
-    def test_absolute_path(self):
-        self.assertEqual(_split_all("/a/b"), ["/", "a", "b"])
-
-    def test_absolute_single(self):
-        self.assertEqual(_split_all("/a"), ["/", "a"])
-
-
-class TestGetRootItems(unittest.TestCase):
-    def _make_file(self, name: str, selected: bool):
-        f = MagicMock()
-        f.name = name
-        f.selected = selected
-        return f
+class _FakeTransmissionClient:
+    def __init__(self, torrents: list[dict[str, object]]):
+        self.torrents = torrents
+        self.arguments = None
+        self.stopped = []
 
-    def test_returns_top_level_dir(self):
-        torrent = MagicMock()
-        torrent.get_files.return_value = [
-            self._make_file("folder/a.txt", True),
-            self._make_file("folder/b.txt", True),
+    async def get_torrents(self, *, arguments=None):
+        self.arguments = arguments
+        fields = ["id"] + (arguments or [])
+        return [
+            Torrent(fields={k: v for k, v in _.items() if k in fields})
+            for _ in self.torrents
         ]
-        self.assertEqual(_get_root_items(torrent), ["folder"])
 
-    def test_excludes_unselected_files(self):
-        torrent = MagicMock()
-        torrent.get_files.return_value = [
-            self._make_file("a/x.txt", True),
-            self._make_file("b/y.txt", False),
-        ]
-        self.assertEqual(_get_root_items(torrent), ["a"])
+    async def stop_torrent(self, torrent_id_list):
+        self.stopped.extend(torrent_id_list)
 
-    def test_multiple_root_dirs(self):
-        torrent = MagicMock()
-        torrent.get_files.return_value = [
-            self._make_file("a/x.txt", True),
-            self._make_file("b/y.txt", True),
-        ]
-        self.assertEqual(sorted(_get_root_items(torrent)), ["a", "b"])
 
-    def test_deduplicates_same_root(self):
+class TestGetFileList(unittest.TestCase):
+    def test_returns_selected_relative_paths(self):
         torrent = MagicMock()
-        torrent.get_files.return_value = [
-            self._make_file("folder/a.txt", True),
-            self._make_file("folder/b.txt", True),
-            self._make_file("folder/sub/c.txt", True),
-        ]
-        self.assertEqual(_get_root_items(torrent), ["folder"])
+        files = [MagicMock(selected=True), MagicMock(selected=False)]
+        files[0].name = "folder/a.txt"
+        files[1].name = "folder/b.txt"
+        torrent.get_files.return_value = files
+        self.assertEqual(_get_file_list(torrent), ["folder/a.txt"])
 
     def test_no_selected_files(self):
         torrent = MagicMock()
-        torrent.get_files.return_value = [
-            self._make_file("a/x.txt", False),
-        ]
-        self.assertEqual(_get_root_items(torrent), [])
-
-    def test_empty_file_list(self):
-        torrent = MagicMock()
-        torrent.get_files.return_value = []
-        self.assertEqual(_get_root_items(torrent), [])
+        files = [MagicMock(selected=False)]
+        files[0].name = "a/x.txt"
+        torrent.get_files.return_value = files
+        self.assertEqual(_get_file_list(torrent), [])
 
 
 class TestGetRootDir(unittest.TestCase):
@@ -116,6 +86,7 @@ class TestScheduleUploadById(unittest.TestCase):
             task_manager=manager,
             uploader=uploader,
             transmission=transmission,
+            torrent_client=MagicMock(),
             torrent_id=123,
         )
 
@@ -131,8 +102,42 @@ class TestScheduleUploadById(unittest.TestCase):
             task_manager=manager,
             uploader=uploader,
             transmission=transmission,
+            torrent_client=MagicMock(),
             torrent_id=123,
         )
 
         self.assertTrue(accepted)
         self.assertEqual(manager.calls[0][0], ("torrent", 123))
+        self.assertEqual(manager.args[0], {"torrent_id": 123})
+
+
+class TestGetCompleted(unittest.IsolatedAsyncioTestCase):
+    async def test_returns_finished_torrents_with_limited_fields(self):
+        client = _FakeTransmissionClient(
+            [
+                {"id": 1, "leftUntilDone": 0, "peers": []},
+                {"id": 2, "leftUntilDone": 10, "peers": []},
+            ]
+        )
+
+        result = await get_completed(client)
+
+        self.assertEqual([_.id for _ in result], [1])
+        self.assertEqual(sorted(client.arguments), ["id", "leftUntilDone"])
+
+
+class TestHaltPendingTorrents(unittest.IsolatedAsyncioTestCase):
+    async def test_stops_downloading_torrents_without_data(self):
+        client = _FakeTransmissionClient(
+            [
+                {"id": 1, "status": 4, "downloadedEver": 0},
+                {"id": 2, "status": 4, "downloadedEver": 5},
+                {"id": 3, "status": 6, "downloadedEver": 0},
+            ]
+        )
+
+        result = await _halt_pending_torrents(client)
+
+        self.assertEqual(result, [1])
+        self.assertEqual(client.stopped, [1])
+        self.assertEqual(sorted(client.arguments), ["downloadedEver", "id", "status"])
@@ -0,0 +1,86 @@
+import asyncio
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import MagicMock, patch
+
+from transmission_rpc import TransmissionConnectError
+
+from duld.transmission import TransmissionClient, create_transmission_client
+
+
+class TestTransmissionClient(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.pool = ThreadPoolExecutor(max_workers=1)
+        self.clients: list[MagicMock] = []
+        patcher = patch("duld.transmission._create_client", self._create_client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.adapter = TransmissionClient(MagicMock(), pool=self.pool)
+
+    def tearDown(self):
+        self.pool.shutdown()
+
+    def _create_client(self, transmission):
+        client = MagicMock()
+        self.clients.append(client)
+        return client
+
+    async def test_get_torrent_returns_none_when_missing(self):
+        await self.adapter.get_session()
+        self.clients[0].get_torrent.side_effect = KeyError("not found")
+        self.assertIsNone(await self.adapter.get_torrent(1))
+
+    async def test_add_torrent_forwards_arguments(self):
+        await self.adapter.add_torrent("magnet:?xt=1", paused=True)
+        self.clients[0].add_torrent.assert_called_once_with("magnet:?xt=1", paused=True)
+
+    async def test_client_is_reused_across_calls(self):
+        await self.adapter.get_session()
+        await self.adapter.get_torrents()
+        await self.adapter.free_space("/downloads")
+        self.assertEqual(len(self.clients), 1)
+
+    async def test_reconnects_after_connection_error(self):
+        await self.adapter.get_session()
+        self.clients[0].get_torrents.side_effect = TransmissionConnectError("down")
+        with self.assertRaises(TransmissionConnectError):
+            await self.adapter.get_torrents()
+
+        await self.adapter.get_torrents()
+        self.assertEqual(len(self.clients), 2)
+
+    async def test_stalled_daemon_does_not_block_event_loop(self):
+        await self.adapter.get_session()
+        self.clients[0].get_torrents.side_effect = lambda **_: time.sleep(0.3) or []
+
+        ticks = 0
+
+        async def tick():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        ticker = asyncio.create_task(tick())
+        try:
+            self.assertEqual(await self.adapter.get_torrents(), [])
+        finally:
+            ticker.cancel()
+        # A blocked loop would not tick at all during the 0.3 s stall.
+        self.assertGreater(ticks, 10)
+
+
+class TestCreateTransmissionClient(unittest.IsolatedAsyncioTestCase):
+    async def test_closes_connection_on_exit(self):
+        created = MagicMock()
+        with patch("duld.transmission._create_client", return_value=created):
+            async with create_transmission_client(MagicMock()) as client:
+                await client.get_session()
+        created.__exit__.assert_called_once()
+
+    async def test_unused_client_does_not_connect_to_close(self):
+        with patch("duld.transmission._create_client") as create_client:
+            async with create_transmission_client(MagicMock()):
+                pass
+        create_client.assert_not_called()
@@ -1,8 +1,45 @@
 import asyncio
 import unittest
 from contextlib import nullcontext
+from pathlib import Path
+from tempfile import TemporaryDirectory
 
-from duld.upload._core import _make_job_context, job_guard
+from duld.dfd import _to_regex_list
+from duld.lib import Compressor
+from duld.progress import JobProgress, set_progress
+from duld.upload._core import (
+    ByteBudget,
+    _DefaultUploader,
+    _EntryCache,
+    _make_job_context,
+    _run_pipeline,
+    job_guard,
+)
+from duld.upload._local import LocalBackend
+
+
+class _FakeDfdClient:
+    def __init__(self, filters=None):
+        self.filters = filters or []
+
+    async def fetch_filters(self):
+        return self.filters
+
+
+class _CountingBackend(LocalBackend):
+    def __init__(self, *, upload_to: Path) -> None:
+        super().__init__(upload_to=upload_to)
+        self.running = 0
+        self.peak = 0
+
+    async def upload_file(self, local_path, parent, *, name):
+        self.running += 1
+        self.peak = max(self.peak, self.running)
+        try:
+            await asyncio.sleep(0.01)
+            return await super().upload_file(local_path, parent, name=name)
+        finally:
+            self.running -= 1
 
 
 class TestJobGuard(unittest.TestCase):
@@ -56,3 +93,380 @@ class TestMakeJobContext(unittest.TestCase):
         self.assertIsInstance(ctx, asyncio.Semaphore)
         # Semaphore._value holds the count before any acquire
         self.assertEqual(ctx._value, 5)
+
+
+class _LookupCountingBackend(LocalBackend):
+    def __init__(self, *, upload_to: Path) -> None:
+        super().__init__(upload_to=upload_to)
+        self.get_child_calls = 0
+        self.resolve_path_calls = 0
+
+    async def get_child(self, name, parent):
+        self.get_child_calls += 1
+        return await super().get_child(name, parent)
+
+    async def resolve_path(self, entry):
+        self.resolve_path_calls += 1
+        return await super().resolve_path(entry)
+
+
+class TestEntryCache(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self._tmp = TemporaryDirectory()
+        self.root = Path(self._tmp.name)
+        self.backend = _LookupCountingBackend(upload_to=self.root)
+        self.cache = _EntryCache(self.backend)
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    async def test_get_child_is_looked_up_once(self):
+        (self.root / "a").mkdir()
+        self.assertEqual(await self.cache.get_child("a", self.root), self.root / "a")
+        self.assertEqual(await self.cache.get_child("a", self.root), self.root / "a")
+        self.assertEqual(self.backend.get_child_calls, 1)
+
+    async def test_created_folder_replaces_missing_child(self):
+        self.assertIsNone(await self.cache.get_child("a", self.root))
+        created = await self.cache.create_folder("a", self.root)
+        self.assertEqual(await self.cache.get_child("a", self.root), created)
+        self.assertEqual(self.backend.get_child_calls, 1)
+
+    async def test_uploaded_file_replaces_missing_child(self):
+        src = self.root / "src.txt"
+        src.write_bytes(b"x")
+        dst = await self.cache.create_folder("dst", self.root)
+        self.assertIsNone(await self.cache.get_child("f.txt", dst))
+        uploaded = await self.cache.upload_file(src, dst, name="f.txt")
+        self.assertEqual(await self.cache.get_child("f.txt", dst), uploaded)
+
+    async def test_resolve_path_is_cached(self):
+        for _ in range(3):
+            await self.cache.resolve_path(self.root)
+        self.assertEqual(self.backend.resolve_path_calls, 1)
+
+    async def test_clear_forgets_everything(self):
+        await self.cache.get_child("a", self.root)
+        await self.cache.resolve_path(self.root)
+        self.cache.clear()
+        await self.cache.get_child("a", self.root)
+        await self.cache.resolve_path(self.root)
+        self.assertEqual(self.backend.get_child_calls, 2)
+        self.assertEqual(self.backend.resolve_path_calls, 2)
+
+
+class TestUploadTree(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self._tmp = TemporaryDirectory()
+        root = Path(self._tmp.name)
+        self.src = root / "src"
+        self.dst = root / "dst"
+        self.dst.mkdir()
+        (self.src / "a" / "b").mkdir(parents=True)
+        (self.src / "x.txt").write_bytes(b"x")
+        (self.src / "a" / "y.txt").write_bytes(b"yy")
+        (self.src / "a" / "b" / "z.txt").write_bytes(b"zzz")
+        (self.src / "a" / "b" / "sample.txt").write_bytes(b"s")
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def _make_uploader(self, backend, *, max_files=1):
+        return _DefaultUploader(
+            backend=backend,
+            dfd_client=_FakeDfdClient(),
+            compressor=Compressor(max_jobs=1, threads=1),
+            max_files=max_files,
+        )
+
+    async def test_uploads_whole_tree(self):
+        backend = LocalBackend(upload_to=self.dst)
+        uploader = self._make_uploader(backend, max_files=2)
+        await uploader.upload_from_path(self.src)
+        self.assertEqual((self.dst / "src" / "x.txt").read_bytes(), b"x")
+        self.assertEqual((self.dst / "src" / "a" / "y.txt").read_bytes(), b"yy")
+        self.assertEqual((self.dst / "src" / "a" / "b" / "z.txt").read_bytes(), b"zzz")
+
+    async def test_default_uploads_one_file_at_a_time(self):
+        backend = _CountingBackend(upload_to=self.dst)
+        uploader = self._make_uploader(backend)
+        await uploader.upload_from_path(self.src)
+        self.assertEqual(backend.peak, 1)
+
+    async def test_file_concurrency_is_bounded(self):
+        backend = _CountingBackend(upload_to=self.dst)
+        uploader = self._make_uploader(backend, max_files=2)
+        await uploader.upload_from_path(self.src)
+        self.assertEqual(backend.peak, 2)
+
+    async def test_parent_path_is_resolved_once_per_folder(self):
+        backend = _LookupCountingBackend(upload_to=self.dst)
+        uploader = self._make_uploader(backend)
+        await uploader.upload_from_path(self.src)
+        # src, src/a, src/a/b
+        self.assertEqual(backend.resolve_path_calls, 3)
+
+    async def test_excluded_files_are_skipped_in_subfolders(self):
+        backend = LocalBackend(upload_to=self.dst)
+        uploader = self._make_uploader(backend)
+        filters = _to_regex_list(["sample"])
+        root = await backend.get_root_folder()
+        await uploader._upload(root, self.src, filters=filters)
+        self.assertTrue((self.dst / "src" / "a" / "b" / "z.txt").exists())
+        self.assertFalse((self.dst / "src" / "a" / "b" / "sample.txt").exists())
+
+    async def test_torrent_upload_follows_file_list(self):
+        backend = LocalBackend(upload_to=self.dst)
+        uploader = _DefaultUploader(
+            backend=backend,
+            dfd_client=_FakeDfdClient(_to_regex_list(["b"])),
+            compressor=Compressor(max_jobs=1, threads=1),
+        )
+        (self.src / "a" / "extra.txt").write_bytes(b"not in torrent")
+        await uploader.upload_from_torrent(
+            1,
+            str(self.src),
+            ["x.txt", "a/y.txt", "a/b/z.txt", "a/b/sample.txt"],
+        )
+        self.assertEqual((self.dst / "x.txt").read_bytes(), b"x")
+        self.assertEqual((self.dst / "a" / "y.txt").read_bytes(), b"yy")
+        self.assertFalse((self.dst / "a" / "b").exists())
+        self.assertFalse((self.dst / "a" / "extra.txt").exists())
+
+    async def test_torrent_upload_skips_missing_files(self):
+        backend = LocalBackend(upload_to=self.dst)
+        uploader = self._make_uploader(backend)
+        await uploader.upload_from_torrent(
+            1,
+            str(self.src),
+            ["x.txt", "gone.txt", "a/y.txt", "a/gone.txt", "c/gone.txt"],
+        )
+        self.assertEqual((self.dst / "x.txt").read_bytes(), b"x")
+        self.assertEqual((self.dst / "a" / "y.txt").read_bytes(), b"yy")
+        self.assertFalse((self.dst / "a" / "gone.txt").exists())
+        self.assertFalse((self.dst / "c").exists())
+
+
+class TestRunPipeline(unittest.IsolatedAsyncioTestCase):
+    async def test_consumes_every_result(self):
+        consumed = []
+
+        async def produce(item):
+            await asyncio.sleep(0)
+            return item * 10
+
+        async def consume(item):
+            consumed.append(item)
+
+        await _run_pipeline(range(5), produce, consume, workers=2, depth=1)
+        self.assertEqual(sorted(consumed), [0, 10, 20, 30, 40])
+
+    async def test_producers_are_bounded(self):
+        running = 0
+        peak = 0
+
+        async def produce(item):
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+            return item
+
+        async def consume(item):
+            pass
+
+        await _run_pipeline(range(6), produce, consume, workers=2, depth=1)
+        self.assertEqual(peak, 2)
+
+    async def test_produces_while_consuming(self):
+        events = []
+
+        async def produce(item):
+            events.append(("produce", item))
+            return item
+
+        async def consume(item):
+            await asyncio.sleep(0.01)
+            events.append(("consume", item))
+
+        await _run_pipeline(range(3), produce, consume, workers=1, depth=1)
+        first_consume = events.index(("consume", 0))
+        self.assertIn(("produce", 1), events[:first_consume])
+
+    async def test_consumer_error_stops_pipeline(self):
+        async def produce(item):
+            return item
+
+        async def consume(item):
+            raise RuntimeError("boom")
+
+        with self.assertRaises(ExceptionGroup):
+            await _run_pipeline(range(3), produce, consume, workers=1, depth=1)
+
+
+class TestByteBudget(unittest.IsolatedAsyncioTestCase):
+    async def test_no_limit_never_waits(self):
+        budget = ByteBudget(0)
+        await budget.acquire(10**12)
+        await budget.acquire(10**12)
+        self.assertEqual(budget.used, 2 * 10**12)
+
+    async def test_waits_until_bytes_are_released(self):
+        budget = ByteBudget(100)
+        await budget.acquire(60)
+        waiter = asyncio.create_task(budget.acquire(60))
+        await asyncio.sleep(0)
+        self.assertFalse(waiter.done())
+
+        budget.release(60)
+        await waiter
+        self.assertEqual(budget.used, 60)
+
+    async def test_oversized_work_runs_alone(self):
+        budget = ByteBudget(100)
+        await budget.acquire(500)
+        self.assertEqual(budget.used, 500)
+        waiter = asyncio.create_task(budget.acquire(1))
+        await asyncio.sleep(0)
+        self.assertFalse(waiter.done())
+        budget.release(500)
+        await waiter
+
+    async def test_waiters_are_served_in_order(self):
+        budget = ByteBudget(100)
+        await budget.acquire(50)
+        large = asyncio.create_task(budget.acquire(100))
+        await asyncio.sleep(0)
+        # Fits right now, but must not overtake the large one.
+        small = asyncio.create_task(budget.acquire(10))
+        await asyncio.sleep(0)
+        self.assertFalse(small.done())
+
+        budget.release(50)
+        await large
+        self.assertFalse(small.done())
+        budget.release(100)
+        await small
+
+    async def test_cancelled_waiter_unblocks_the_next(self):
+        budget = ByteBudget(100)
+        await budget.acquire(50)
+        large = asyncio.create_task(budget.acquire(100))
+        await asyncio.sleep(0)
+        small = asyncio.create_task(budget.acquire(10))
+        await asyncio.sleep(0)
+
+        large.cancel()
+        await small
+        self.assertEqual(budget.used, 60)
+
+
+class _FakeCompressor:
+    def __init__(self, work_dir: Path):
+        self.work_dir = work_dir
+        self.archives: list[Path] = []
+
+    def temporary_directory(self):
+        return TemporaryDirectory(dir=self.work_dir)
+
+    async def compress(self, src_path, dst_path, *, base_name, kind):
+        archive = dst_path / f"{base_name}.7z"
+        archive.write_bytes(b"7z" * 100)
+        self.archives.append(archive)
+        return archive
+
+
+class TestUploadBudget(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self._tmp = TemporaryDirectory()
+        root = Path(self._tmp.name)
+        self.src = root / "src"
+        self.dst = root / "dst"
+        self.work = root / "work"
+        for _ in (self.src, self.dst, self.work):
+            _.mkdir()
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    async def test_jobs_over_budget_wait_for_each_other(self):
+        for name in ("a", "b"):
+            (self.src / name).write_bytes(b"x" * 100)
+        backend = _CountingBackend(upload_to=self.dst)
+        uploader = _DefaultUploader(
+            backend=backend,
+            dfd_client=_FakeDfdClient(),
+            compressor=Compressor(max_jobs=1, threads=1),
+            max_bytes=150,
+        )
+        await asyncio.gather(
+            uploader.upload_from_path(self.src / "a"),
+            uploader.upload_from_path(self.src / "b"),
+        )
+        self.assertEqual(backend.peak, 1)
+        self.assertEqual(uploader._budget.used, 0)
+
+    async def test_archives_are_removed_after_upload(self):
+        names = ["one [AVIF][DL版]", "two [AVIF][DL版]"]
+        for name in names:
+            (self.src / name).mkdir()
+            (self.src / name / "1.avif").write_bytes(b"a" * 100)
+        compressor = _FakeCompressor(self.work)
+        uploader = _DefaultUploader(
+            backend=LocalBackend(upload_to=self.dst),
+            dfd_client=_FakeDfdClient(),
+            compressor=compressor,  # type: ignore
+            max_scratch_bytes=150,
+        )
+        await uploader.upload_from_torrent(
+            1, str(self.src), [f"{_}/1.avif" for _ in names]
+        )
+        self.assertEqual(len(compressor.archives), 2)
+        for archive in compressor.archives:
+            self.assertFalse(archive.exists())
+            self.assertTrue((self.dst / archive.name).exists())
+        self.assertEqual(uploader._scratch.used, 0)
+
+
+class TestUploadProgress(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self._tmp = TemporaryDirectory()
+        root = Path(self._tmp.name)
+        self.src = root / "src"
+        self.dst = root / "dst"
+        self.dst.mkdir()
+        (self.src / "a").mkdir(parents=True)
+        (self.src / "x.txt").write_bytes(b"x")
+        (self.src / "a" / "y.txt").write_bytes(b"yy")
+        self.progress = JobProgress("link:u", "link")
+        set_progress(self.progress)
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def _make_uploader(self, backend):
+        return _DefaultUploader(
+            backend=backend,
+            dfd_client=_FakeDfdClient(),
+            compressor=Compressor(max_jobs=1, threads=1),
+        )
+
+    async def test_counts_files_and_bytes(self):
+        uploader = self._make_uploader(LocalBackend(upload_to=self.dst))
+        await uploader.upload_from_path(self.src)
+        self.assertEqual(self.progress.files_total, 2)
+        self.assertEqual(self.progress.files_done, 2)
+        self.assertEqual(self.progress.bytes_total, 3)
+        self.assertEqual(self.progress.bytes_done, 3)
+        self.assertEqual(self.progress.phase, "verifying")
+
+    async def test_existing_files_count_as_done(self):
+        uploader = self._make_uploader(LocalBackend(upload_to=self.dst))
+        await uploader.upload_from_path(self.src)
+        self.progress = JobProgress("link:u", "link")
+        set_progress(self.progress)
+
+        await uploader.upload_from_path(self.src)
+        self.assertEqual(self.progress.files_done, 2)
+        self.assertEqual(self.progress.bytes_done, 3)
@@ -0,0 +1,408 @@
+import asyncio
+import hashlib
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from pathlib import Path, PurePath
+from tempfile import TemporaryDirectory
+from unittest.mock import MagicMock, patch
+
+from wcpan.drive.core.exceptions import NodeNotFoundError
+
+from duld.progress import JobProgress, set_progress
+from duld.upload._core import HashError, UploadError
+from duld.upload._drive import DriveBackend
+
+
+class _FakeDrive:
+    def __init__(self):
+        self.sync_calls = 0
+        self.gate: asyncio.Event | None = None
+        self.cached: set[str] = set()
+        self.pending: list[object] = []
+
+    async def sync(self):
+        self.sync_calls += 1
+        if self.gate:
+            await self.gate.wait()
+        pending, self.pending = self.pending, []
+        for node in pending:
+            self.cached.add(node.id)
+            yield (False, node)
+
+    async def resolve_path(self, node):
+        if node.id not in self.cached:
+            raise NodeNotFoundError(node.id)
+        return PurePath("/upload", node.name)
+
+    async def get_hasher_factory(self, node):
+        return _create_md5_hasher
+
+    @asynccontextmanager
+    async def upload_file(self, *, name, parent, size, mime_type, media_info):
+        self.uploaded = _FakeWritableFile(name, mime_type)
+        yield self.uploaded
+
+
+class _FakeWritableFile:
+    def __init__(self, name, mime_type):
+        self.name = name
+        self.mime_type = mime_type
+        self.data = bytearray()
+
+    async def write(self, chunk):
+        self.data += chunk
+        return len(chunk)
+
+    async def flush(self):
+        pass
+
+    async def node(self):
+        node = _make_node(f"uploaded-{self.name}")
+        node.hash = hashlib.md5(self.data).hexdigest()
+        return node
+
+
+class _Md5Hasher:
+    def __init__(self):
+        self._hasher = hashlib.md5()
+
+    async def update(self, data):
+        self._hasher.update(data)
+
+    async def hexdigest(self):
+        return self._hasher.hexdigest()
+
+
+async def _create_md5_hasher():
+    return _Md5Hasher()
+
+
+class _SlowHasher:
+    def __init__(self):
+        self._size = 0
+
+    async def update(self, data):
+        # Stands in for hashing a large file.
+        time.sleep(0.01)
+        self._size += len(data)
+
+    async def hexdigest(self):
+        return str(self._size)
+
+
+async def _create_slow_hasher():
+    return _SlowHasher()
+
+
+class _LagProbe:
+    """
+    Counts how often the loop gets to run a 10 ms sleep.
+    """
+
+    def __init__(self):
+        self.ticks = 0
+        self._task = None
+
+    async def __aenter__(self):
+        self._task = asyncio.create_task(self._run())
+        return self
+
+    async def __aexit__(self, *args):
+        self._task.cancel()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(0.01)
+            self.ticks += 1
+
+
+def _make_node(id_: str):
+    node = MagicMock()
+    node.id = id_
+    node.name = f"name-{id_}"
+    return node
+
+
+class _DriveBackendTestCase(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        patcher = patch("duld.upload._drive._SYNC_DELAY", 0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.drive = _FakeDrive()
+
+    def _make_backend(self, sync_interval: float = 0, materialize_timeout: float = 600):
+        return DriveBackend(
+            pool=None,  # type: ignore
+            drive=self.drive,  # type: ignore
+            upload_to=PurePath("/upload"),
+            sync_interval=sync_interval,
+            materialize_timeout=materialize_timeout,
+        )
+
+
+class TestDriveBackendSync(_DriveBackendTestCase):
+    async def test_concurrent_syncs_share_one_pull(self):
+        backend = self._make_backend()
+        self.drive.gate = asyncio.Event()
+        tasks = [asyncio.create_task(backend.sync()) for _ in range(5)]
+        await asyncio.sleep(0.01)
+        self.drive.gate.set()
+        await asyncio.gather(*tasks)
+        self.assertEqual(self.drive.sync_calls, 1)
+        self.assertEqual(backend.sync_count, 1)
+
+    async def test_sync_after_pull_began_pulls_again(self):
+        backend = self._make_backend()
+        self.drive.gate = asyncio.Event()
+        first = asyncio.create_task(backend.sync())
+        await asyncio.sleep(0.01)
+        self.assertEqual(self.drive.sync_calls, 1)
+        # Must see a change made while the first pull is running.
+        second = asyncio.create_task(backend.sync())
+        await asyncio.sleep(0.01)
+        self.drive.gate.set()
+        await asyncio.gather(first, second)
+        self.assertEqual(self.drive.sync_calls, 2)
+
+    async def test_sequential_syncs_pull_again(self):
+        backend = self._make_backend()
+        await backend.sync()
+        await backend.sync()
+        self.assertEqual(self.drive.sync_calls, 2)
+        self.assertEqual(backend.sync_count, 2)
+
+    async def test_fresh_sync_is_skipped(self):
+        backend = self._make_backend(sync_interval=60)
+        await backend.sync()
+        await backend.sync()
+        self.assertEqual(self.drive.sync_calls, 1)
+
+    async def test_forced_sync_ignores_freshness(self):
+        backend = self._make_backend(sync_interval=60)
+        await backend.sync()
+        await backend.sync(force=True)
+        self.assertEqual(self.drive.sync_calls, 2)
+
+    async def test_cancelled_waiter_does_not_cancel_shared_sync(self):
+        backend = self._make_backend()
+        self.drive.gate = asyncio.Event()
+        first = asyncio.create_task(backend.sync())
+        second = asyncio.create_task(backend.sync())
+        await asyncio.sleep(0.01)
+        first.cancel()
+        self.drive.gate.set()
+        await second
+        self.assertEqual(backend.sync_count, 1)
+
+
+class TestDriveBackendEnsureEntryExists(_DriveBackendTestCase):
+    async def test_cached_entry_returns_without_sync(self):
+        backend = self._make_backend()
+        node = _make_node("a")
+        self.drive.cached.add("a")
+        await backend.ensure_entry_exists(node)
+        self.assertEqual(self.drive.sync_calls, 0)
+        self.assertEqual(backend.materialize_count, 1)
+
+    async def test_waits_for_sync_to_bring_entry(self):
+        backend = self._make_backend()
+        node = _make_node("a")
+        self.drive.pending.append(node)
+        await backend.ensure_entry_exists(node)
+        self.assertEqual(self.drive.sync_calls, 1)
+        self.assertEqual(backend.materialize_count, 1)
+
+    async def test_gives_up_after_deadline(self):
+        backend = self._make_backend(materialize_timeout=0.05)
+        with patch("duld.upload._drive._BACKOFF_INITIAL", 0.01):
+            with self.assertRaises(UploadError):
+                await backend.ensure_entry_exists(_make_node("a"))
+        self.assertEqual(backend.materialize_count, 0)
+        self.assertEqual(backend._waiters, {})
+
+    async def test_other_sync_wakes_waiter_during_backoff(self):
+        backend = self._make_backend()
+        node = _make_node("a")
+        with patch("duld.upload._drive._BACKOFF_INITIAL", 60):
+            waiter = asyncio.create_task(backend.ensure_entry_exists(node))
+            await asyncio.sleep(0.01)
+            self.assertFalse(waiter.done())
+
+            self.drive.pending.append(node)
+            await backend.sync()
+            async with asyncio.timeout(1):
+                await waiter
+        self.assertEqual(backend.materialize_count, 1)
+
+
+class TestDriveBackendOffloading(_DriveBackendTestCase):
+    def setUp(self):
+        super().setUp()
+        self._tmp = TemporaryDirectory()
+        self.path = Path(self._tmp.name, "video.mkv")
+        self.path.write_bytes(b"x" * (64 * 1024 * 30))
+        self.pool = ThreadPoolExecutor()
+
+    def tearDown(self):
+        self.pool.shutdown()
+        self._tmp.cleanup()
+
+    def _make_backend(self, **kwargs):
+        backend = super()._make_backend(**kwargs)
+        backend._pool = self.pool
+        return backend
+
+    async def test_verify_file_keeps_loop_responsive(self):
+        async def get_hasher_factory(node):
+            return _create_slow_hasher
+
+        self.drive.get_hasher_factory = get_hasher_factory
+        backend = self._make_backend()
+        node = _make_node("a")
+        node.hash = str(self.path.stat().st_size)
+
+        async with _LagProbe() as probe:
+            await backend.verify_file(self.path, node, PurePath("/upload/a"))
+        self.assertGreater(probe.ticks, 10)
+
+    async def test_verify_file_detects_mismatch(self):
+        async def get_hasher_factory(node):
+            return _create_slow_hasher
+
+        self.drive.get_hasher_factory = get_hasher_factory
+        backend = self._make_backend()
+        node = _make_node("a")
+        node.hash = "0"
+
+        with self.assertRaises(HashError):
+            await backend.verify_file(self.path, node, PurePath("/upload/a"))
+
+    async def test_upload_keeps_loop_responsive(self):
+        async def get_hasher_factory(node):
+            return _create_slow_hasher
+
+        self.drive.get_hasher_factory = get_hasher_factory
+        backend = self._make_backend()
+        with (
+            patch("duld.upload._drive._get_file_info", return_value=("", None)),
+            patch("duld.upload._drive._CHUNK_SIZE", 64 * 1024),
+        ):
+            async with _LagProbe() as probe:
+                await backend.upload_file(self.path, _make_node("p"), name="video.mkv")
+        self.assertEqual(len(self.drive.uploaded.data), self.path.stat().st_size)
+        self.assertGreater(probe.ticks, 10)
+
+    async def test_media_probing_keeps_loop_responsive(self):
+        def slow_media_info(path):
+            time.sleep(0.3)
+            return None
+
+        backend = self._make_backend()
+        with (
+            patch("duld.upload._drive.get_mime_type", return_value="video/x-matroska"),
+            patch("duld.upload._drive.get_media_info", slow_media_info),
+        ):
+            async with _LagProbe() as probe:
+                await backend.upload_file(self.path, _make_node("p"), name="video.mkv")
+        self.assertEqual(self.drive.uploaded.mime_type, "video/x-matroska")
+        self.assertGreater(probe.ticks, 10)
+
+
+class TestDriveBackendUploadHash(_DriveBackendTestCase):
+    def setUp(self):
+        super().setUp()
+        self._tmp = TemporaryDirectory()
+        self.path = Path(self._tmp.name, "file.bin")
+        self.path.write_bytes(bytes(range(256)) * 4096)
+        patcher = patch("duld.upload._drive._get_file_info", return_value=("", None))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    async def test_uploads_whole_file(self):
+        backend = self._make_backend()
+        await backend.upload_file(self.path, _make_node("p"), name="file.bin")
+        self.assertEqual(bytes(self.drive.uploaded.data), self.path.read_bytes())
+        self.assertEqual(self.drive.uploaded.mime_type, "application/octet-stream")
+
+    async def test_verify_uses_hash_from_upload(self):
+        backend = self._make_backend()
+        child = await backend.upload_file(self.path, _make_node("p"), name="file.bin")
+        with patch("duld.upload._drive.get_file_hash") as get_file_hash:
+            await backend.verify_file(self.path, child, PurePath("/upload/file.bin"))
+        get_file_hash.assert_not_called()
+
+    async def test_verify_rehashes_existing_file(self):
+        backend = self._make_backend()
+        node = _make_node("existing")
+        node.hash = "remote"
+
+        async def fake_hash(path, **kwargs):
+            return "remote"
+
+        with patch("duld.upload._drive.get_file_hash", fake_hash):
+            await backend.verify_file(self.path, node, PurePath("/upload/file.bin"))
+
+    async def test_upload_hash_is_used_once(self):
+        backend = self._make_backend()
+        child = await backend.upload_file(self.path, _make_node("p"), name="file.bin")
+        await backend.verify_file(self.path, child, PurePath("/upload/file.bin"))
+        self.assertEqual(backend._uploaded_hashes, {})
+
+    async def test_sent_bytes_are_counted(self):
+        progress = JobProgress("torrent:1", "torrent")
+        set_progress(progress)
+        backend = self._make_backend()
+        await backend.upload_file(self.path, _make_node("p"), name="file.bin")
+        self.assertEqual(progress.bytes_done, self.path.stat().st_size)
+
+    async def test_failed_upload_takes_back_its_bytes(self):
+        progress = JobProgress("torrent:1", "torrent")
+        set_progress(progress)
+        backend = self._make_backend()
+        with patch.object(
+            _FakeWritableFile, "node", side_effect=RuntimeError("broken")
+        ):
+            with self.assertRaises(RuntimeError):
+                await backend.upload_file(self.path, _make_node("p"), name="file.bin")
+        self.assertEqual(progress.bytes_done, 0)
+
+    async def test_failed_write_stops_reading(self):
+        backend = self._make_backend()
+        with patch.object(
+            _FakeWritableFile, "write", side_effect=RuntimeError("broken")
+        ):
+            with self.assertRaises(RuntimeError):
+                async with asyncio.timeout(5):
+                    await backend.upload_file(
+                        self.path, _make_node("p"), name="file.bin"
+                    )
+        self.assertEqual(backend._uploaded_hashes, {})
+
+    async def test_invalid_remote_hash_keeps_no_local_hash(self):
+        async def node(self):
+            node = _make_node("no-hash")
+            node.hash = None
+            return node
+
+        backend = self._make_backend()
+        progress = JobProgress("torrent:1", "torrent")
+        set_progress(progress)
+        with patch.object(_FakeWritableFile, "node", node):
+            with self.assertRaises(UploadError):
+                await backend.upload_file(self.path, _make_node("p"), name="file.bin")
+        self.assertEqual(backend._uploaded_hashes, {})
+        # The retry sends it all again.
+        self.assertEqual(progress.bytes_done, 0)
+
+    async def test_hash_mismatch_drops_local_hash(self):
+        backend = self._make_backend()
+        child = await backend.upload_file(self.path, _make_node("p"), name="file.bin")
+        child.hash = "other"
+        with self.assertRaises(HashError):
+            await backend.verify_file(self.path, child, PurePath("/upload/file.bin"))
+        self.assertEqual(backend._uploaded_hashes, {})
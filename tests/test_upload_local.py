@@ -1,9 +1,12 @@
+import errno
+import os
 import unittest
 from pathlib import Path, PurePath
 from tempfile import TemporaryDirectory
+from unittest.mock import patch
 
 from duld.upload._core import UploadError
-from duld.upload._local import LocalBackend
+from duld.upload._local import LocalBackend, _copy_file, _hash_file
 
 
 class TestLocalBackend(unittest.IsolatedAsyncioTestCase):
@@ -15,6 +18,9 @@ class TestLocalBackend(unittest.IsolatedAsyncioTestCase):
     def tearDown(self):
         self._tmp.cleanup()
 
+    def test_get_id_is_the_path(self):
+        self.assertEqual(self.backend.get_id(self.root), self.root)
+
     async def test_get_root_folder(self):
         result = await self.backend.get_root_folder()
         self.assertEqual(result, self.root)
@@ -96,3 +102,160 @@ class TestLocalBackend(unittest.IsolatedAsyncioTestCase):
         f = self.root / "file.txt"
         f.write_text("x", encoding="utf-8")
         self.assertFalse(await self.backend.is_directory(f))
+
+
+class TestLocalBackendMoveFiles(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self._tmp = TemporaryDirectory()
+        self.root = Path(self._tmp.name)
+        self.backend = LocalBackend(upload_to=self.root, move_files=True)
+        self.src = self.root / "source.txt"
+        self.src.write_bytes(b"hello")
+        self.dest_dir = self.root / "dest"
+        self.dest_dir.mkdir()
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    async def test_upload_file_moves_source(self):
+        result = await self.backend.upload_file(self.src, self.dest_dir, name="a.txt")
+        self.assertEqual(result.read_bytes(), b"hello")
+        self.assertFalse(self.src.exists())
+
+    async def test_verify_moved_file_uses_recorded_size(self):
+        result = await self.backend.upload_file(self.src, self.dest_dir, name="a.txt")
+        await self.backend.verify_file(self.src, result, PurePath("/remote/a.txt"))
+
+    async def test_falls_back_to_copy_across_filesystems(self):
+        with patch("os.rename", side_effect=OSError(errno.EXDEV, "cross-device")):
+            result = await self.backend.upload_file(
+                self.src, self.dest_dir, name="a.txt"
+            )
+        self.assertEqual(result.read_bytes(), b"hello")
+        self.assertTrue(self.src.exists())
+
+
+class TestCopyFile(unittest.TestCase):
+    def setUp(self):
+        self._tmp = TemporaryDirectory()
+        self.root = Path(self._tmp.name)
+        self.src = self.root / "src.bin"
+        self.src.write_bytes(bytes(range(256)) * 1024)
+        self.dst = self.root / "dst.bin"
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def test_copies_content_and_mtime(self):
+        _copy_file(self.src, self.dst)
+        self.assertEqual(self.dst.read_bytes(), self.src.read_bytes())
+        self.assertEqual(self.dst.stat().st_mtime, self.src.stat().st_mtime)
+
+    def test_falls_back_without_fast_paths(self):
+        with (
+            patch("duld.upload._local._clone", return_value=False),
+            patch("duld.upload._local._copy_file_range", return_value=False),
+        ):
+            _copy_file(self.src, self.dst)
+        self.assertEqual(self.dst.read_bytes(), self.src.read_bytes())
+
+    def test_copy_file_range_when_clone_is_unsupported(self):
+        with patch("duld.upload._local._clone", return_value=False):
+            _copy_file(self.src, self.dst)
+        self.assertEqual(self.dst.read_bytes(), self.src.read_bytes())
+
+    def test_falls_back_when_copy_file_range_copies_nothing(self):
+        with (
+            patch("duld.upload._local._clone", return_value=False),
+            patch("os.copy_file_range", return_value=0, create=True),
+        ):
+            _copy_file(self.src, self.dst)
+        self.assertEqual(self.dst.read_bytes(), self.src.read_bytes())
+
+    def test_short_copy_file_range_raises(self):
+        with (
+            patch("duld.upload._local._clone", return_value=False),
+            patch("os.copy_file_range", side_effect=[1024, 0], create=True),
+        ):
+            with self.assertRaises(UploadError):
+                _copy_file(self.src, self.dst)
+
+    def test_empty_file(self):
+        self.src.write_bytes(b"")
+        _copy_file(self.src, self.dst)
+        self.assertEqual(self.dst.read_bytes(), b"")
+
+
+class TestLocalBackendVerifyModes(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self._tmp = TemporaryDirectory()
+        self.root = Path(self._tmp.name)
+        self.local = self.root / "local.bin"
+        self.local.write_bytes(b"a" * 4096)
+        self.remote = self.root / "remote.bin"
+        _copy_file(self.local, self.remote)
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def _make_backend(self, verify):
+        return LocalBackend(upload_to=self.root, verify=verify, sample_size=1024)
+
+    def _corrupt(self, offset: int):
+        stat = self.remote.stat()
+        with self.remote.open("r+b") as fout:
+            fout.seek(offset)
+            fout.write(b"b")
+        os.utime(self.remote, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+    async def test_all_modes_accept_identical_copy(self):
+        for verify in ("size", "mtime", "sample", "full"):
+            backend = self._make_backend(verify)
+            await backend.verify_file(self.local, self.remote, PurePath("/r"))
+
+    async def test_mtime_mode_detects_touched_file(self):
+        os.utime(self.remote, ns=(0, 0))
+        await self._make_backend("size").verify_file(
+            self.local, self.remote, PurePath("/r")
+        )
+        with self.assertRaises(UploadError):
+            await self._make_backend("mtime").verify_file(
+                self.local, self.remote, PurePath("/r")
+            )
+
+    async def test_sample_mode_detects_corrupted_tail(self):
+        self._corrupt(4095)
+        await self._make_backend("mtime").verify_file(
+            self.local, self.remote, PurePath("/r")
+        )
+        with self.assertRaises(UploadError):
+            await self._make_backend("sample").verify_file(
+                self.local, self.remote, PurePath("/r")
+            )
+
+    async def test_full_mode_detects_corruption_between_samples(self):
+        self._corrupt(1500)
+        await self._make_backend("sample").verify_file(
+            self.local, self.remote, PurePath("/r")
+        )
+        with self.assertRaises(UploadError):
+            await self._make_backend("full").verify_file(
+                self.local, self.remote, PurePath("/r")
+            )
+
+
+class TestHashFile(unittest.TestCase):
+    def setUp(self):
+        self._tmp = TemporaryDirectory()
+        self.path = Path(self._tmp.name, "file.bin")
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def test_small_file_is_fully_hashed(self):
+        self.path.write_bytes(b"x" * 100)
+        self.assertEqual(_hash_file(self.path, 1024), _hash_file(self.path, None))
+
+    def test_large_file_is_sampled(self):
+        self.path.write_bytes(b"x" * 10000)
+        self.assertNotEqual(_hash_file(self.path, 1024), _hash_file(self.path, None))